@@ -2,23 +2,71 @@ import os
 import shutil
 import asyncio
 import logging
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException, Form
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi.responses import JSONResponse, FileResponse, Response
 from backend.models import UploadResponse, JobStatusResponse, QueryRequest, QueryResult
 from backend.utils.file_ops import save_original_file, allowed_ext, extract_pdfs_from_zip, save_markdown_file
 from backend.utils.conversion import convert_to_markdown
-from backend.utils.embedding import chunk_markdown, get_embeddings
+from backend.utils.embedding import chunk_markdown, get_embeddings, PRIORITY_QUERY
 from backend.utils.faiss_index import create_faiss_index, search_faiss_index, load_faiss_index
 from backend.utils.llm_chain import build_prompt, ask_llm
+from backend.utils.metrics import track_jobs, track_queue, render_metrics
+from backend.utils.tracing import JobProfiler, span, start_trace
+from backend.utils.job_queue import (
+    JobScheduler, QueueFull, JobCancelled, cancel_scope, raise_if_cancelled,
+    PRIORITY_FILE, PRIORITY_BATCH, PRIORITY_ZIP, MAX_QUEUED_JOBS,
+)
+from backend.utils import durable_queue
+from backend import warmup
+import json
 import uuid
-from typing import Dict, List
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
 import tempfile
 import zipfile
 
-app = FastAPI()
+# Прогрев (токенизатор, конвертеры, индексы) идёт в фоне и не задерживает старт;
+# до его окончания /readyz отвечает 503. WARMUP_ON_STARTUP=0 — отключить (проверки
+# отмечаются как skipped, и /readyz сразу отвечает 200).
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") not in ("0", "false", "no")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = None
+    checks = list(warmup.CHECKS)
+    if INGEST_MODE == "queue":
+        # API в режиме queue ничего не конвертирует: модели DocLing грузят только воркеры
+        warmup.skip("converters")
+        checks.remove("converters")
+    if WARMUP_ON_STARTUP:
+        warmup_task = asyncio.create_task(asyncio.to_thread(warmup.warm_up, *checks))
+    else:
+        warmup.skip()
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 # Хранилище статусов задач (in-memory)
 jobs: Dict[str, Dict] = {}
+track_jobs(jobs)
+
+# Очередь фоновых задач (MAX_CONCURRENT_JOBS / MAX_QUEUED_JOBS)
+scheduler = JobScheduler()
+
+# inline — задачи выполняются в этом процессе; queue — API только ставит их
+# в durable-очередь (data/queue.sqlite), выполняют процессы `python -m backend.worker`
+INGEST_MODE = os.getenv("INGEST_MODE", "inline")
+if INGEST_MODE == "queue":
+    track_queue(durable_queue.counts)
+
+# Трассы последних запросов /query (ограниченный LRU)
+TRACE_DIR = os.path.join("data", "traces")
+QUERY_TRACE_LIMIT = int(os.getenv("QUERY_TRACE_LIMIT", "200"))
+query_traces: "OrderedDict[str, Dict]" = OrderedDict()
 
 # ---------- Logging config ----------
 logging.basicConfig(
@@ -35,6 +83,84 @@ def _update_job(job_id: str, *, progress: float | None = None, detail: str | Non
         jobs[job_id]["detail"] = detail
     logger.debug("[job %s] progress=%.2f detail=%s", job_id, jobs[job_id]["progress"], jobs[job_id].get("detail"))
 
+# ---------- Job queue helpers ----------
+
+def _queue_full_error(retry_after: int) -> HTTPException:
+    return HTTPException(status_code=429, detail="Очередь задач заполнена, повторите позже",
+                         headers={"Retry-After": str(retry_after)})
+
+UPLOAD_PATHS = {"/upload-file", "/upload-files", "/upload-zip"}
+
+async def _queue_is_full() -> bool:
+    if INGEST_MODE == "queue":
+        # SQLite может ждать блокировку записи воркера — не в event loop
+        counts = await asyncio.to_thread(durable_queue.counts)
+        return counts.get("queued", 0) >= MAX_QUEUED_JOBS
+    return scheduler.is_full()
+
+class UploadAdmissionMiddleware:
+    """Отклоняет загрузки с 429 при полной очереди ещё до чтения тела запроса.
+
+    Проверка в самом обработчике опоздала бы: FastAPI принимает и разбирает
+    весь multipart для параметров File(...)/Form(...) до вызова обработчика.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in UPLOAD_PATHS
+                and await _queue_is_full()):
+            retry_after = QueueFull().retry_after
+            response = JSONResponse({"detail": "Очередь задач заполнена, повторите позже"}, status_code=429,
+                                    headers={"Retry-After": str(retry_after)})
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+app.add_middleware(UploadAdmissionMiddleware)
+
+def _discard_files(paths: List[str]):
+    """Удаляет сохранённые оригиналы задачи, которую не приняли в очередь."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            logger.warning("[upload] Failed to remove rejected upload %s", path, exc_info=True)
+
+def _new_job(**fields) -> str:
+    job_id = str(uuid.uuid4())
+    jobs[job_id] = {"status": "queued", "progress": 0.0, "detail": None, "cancel_event": threading.Event(), **fields}
+    return job_id
+
+def _enqueue(job_id: str, priority: int, factory: Callable[[], Awaitable[None]], saved_paths: List[str] = ()):
+    # Очередь могла заполниться, пока тело запроса читалось после проверки в middleware
+    try:
+        scheduler.submit(job_id, priority, factory)
+    except QueueFull as e:
+        jobs.pop(job_id, None)
+        _discard_files(saved_paths)
+        raise _queue_full_error(e.retry_after)
+
+async def _enqueue_durable(priority: int, files: List[tuple], pipeline: str, project: str, profile: bool,
+                           file_id: Optional[str] = None) -> UploadResponse:
+    """INGEST_MODE=queue: оригиналы уже сохранены в data/original, воркеру передаём пути."""
+    job_id = str(uuid.uuid4())
+    payload = {"files": files, "pipeline": pipeline, "project": project, "profile": profile}
+    try:
+        await asyncio.to_thread(durable_queue.enqueue, job_id, priority, payload, project=project,
+                                pipeline=pipeline, file_id=file_id, max_queued=MAX_QUEUED_JOBS)
+    except QueueFull as e:
+        _discard_files([path for _, _, path in files])
+        raise _queue_full_error(e.retry_after)
+    return UploadResponse(job_id=job_id)
+
+async def _find_job(job_id: str) -> Optional[Dict]:
+    job = jobs.get(job_id)
+    if job is None and INGEST_MODE == "queue":
+        job = await asyncio.to_thread(durable_queue.get_job, job_id)
+    return job
+
 # ---------- Utils ----------
 
 def _zip_markdown(file_ids: List[str], project: str) -> str:
@@ -51,7 +177,7 @@ def _zip_markdown(file_ids: List[str], project: str) -> str:
     return zip_path
 
 @app.post("/upload-file", response_model=UploadResponse)
-async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...), pipeline: str = Form("docling"), project: str = Form("default")):
+async def upload_file(file: UploadFile = File(...), pipeline: str = Form("docling"), project: str = Form("default"), profile: bool = Form(False)):
     # Проверяем расширение
     ext = file.filename.split(".")[-1].lower()
     if not allowed_ext(file.filename):
@@ -59,14 +185,16 @@ async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File
     logger.info("[upload_file] Received file '%s' (pipeline=%s)", file.filename, pipeline)
     file_bytes = await file.read()
     file_id, orig_path = save_original_file(file_bytes, ext)
-    job_id = str(uuid.uuid4())
-    jobs[job_id] = {"status": "pending", "progress": 0.0, "detail": None, "file_id": file_id, "file_ids": [file_id], "pipeline": pipeline, "project": project}
+    if INGEST_MODE == "queue":
+        return await _enqueue_durable(PRIORITY_FILE, [(file.filename, file_id, orig_path)], pipeline, project, profile,
+                                      file_id=file_id)
+    job_id = _new_job(file_id=file_id, file_ids=[file_id], pipeline=pipeline, project=project, profile_requested=profile)
     logger.debug("[upload_file] Saved original file to %s (file_id=%s, job_id=%s)", orig_path, file_id, job_id)
-    background_tasks.add_task(process_file_job, job_id, orig_path, file_id, pipeline)
+    _enqueue(job_id, PRIORITY_FILE, lambda: process_file_job(job_id, orig_path, file_id, pipeline), [orig_path])
     return UploadResponse(job_id=job_id)
 
 @app.post("/upload-zip", response_model=UploadResponse)
-async def upload_zip(background_tasks: BackgroundTasks, file: UploadFile = File(...), pipeline: str = Form("docling"), project: str = Form("default")):
+async def upload_zip(file: UploadFile = File(...), pipeline: str = Form("docling"), project: str = Form("default"), profile: bool = Form(False)):
     if not file.filename.lower().endswith(".zip"):
         raise HTTPException(status_code=400, detail="Ожидается ZIP-файл")
     logger.info("[upload_zip] Received zip '%s' (pipeline=%s)", file.filename, pipeline)
@@ -75,17 +203,41 @@ async def upload_zip(background_tasks: BackgroundTasks, file: UploadFile = File(
     logger.debug("[upload_zip] Extracted %d pdf(s) from zip", len(pdfs))
     if not pdfs:
         raise HTTPException(status_code=400, detail="В ZIP нет PDF-файлов")
-    job_id = str(uuid.uuid4())
-    jobs[job_id] = {"status": "pending", "progress": 0.0, "detail": None, "zip": True, "count": len(pdfs), "done": 0, "file_ids": [], "pipeline": pipeline, "project": project}
-    background_tasks.add_task(process_zip_job, job_id, pdfs, pipeline)
+    if INGEST_MODE == "queue":
+        saved = [(name, *save_original_file(pdf_bytes, "pdf")) for name, pdf_bytes in pdfs]
+        return await _enqueue_durable(PRIORITY_ZIP, saved, pipeline, project, profile)
+    job_id = _new_job(zip=True, count=len(pdfs), done=0, file_ids=[], pipeline=pipeline, project=project, profile_requested=profile)
+    _enqueue(job_id, PRIORITY_ZIP, lambda: process_zip_job(job_id, pdfs, pipeline))
     return UploadResponse(job_id=job_id)
 
 @app.get("/job-status/{job_id}", response_model=JobStatusResponse)
 async def job_status(job_id: str):
-    job = jobs.get(job_id)
+    job = await _find_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    position = job["queue_position"] if "queue_position" in job else scheduler.position(job_id)
+    return JobStatusResponse(status=job["status"], progress=job["progress"], detail=job.get("detail"),
+                             queue_position=position if job["status"] == "queued" else None)
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Отменяет задачу: из очереди снимается сразу, выполняющаяся останавливается на ближайшей стадии."""
+    job = await _find_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Задача не найдена")
-    return JobStatusResponse(status=job["status"], progress=job["progress"], detail=job.get("detail"))
+    if job["status"] in ("ready", "error", "cancelled"):
+        raise HTTPException(status_code=409, detail=f"Задача уже завершена: {job['status']}")
+    if job_id not in jobs:
+        # Задача в durable-очереди: флаг отмены воркер заберёт со следующим heartbeat
+        outcome = await asyncio.to_thread(durable_queue.cancel, job_id)
+        status = "cancelled" if outcome == "dequeued" else job["status"]
+        return {"job_id": job_id, "status": status, "cancel": outcome or "requested"}
+    job["cancel_event"].set()
+    outcome = scheduler.cancel(job_id)
+    if outcome == "dequeued":
+        job["status"] = "cancelled"
+        _update_job(job_id, detail="Задача отменена до запуска")
+    return {"job_id": job_id, "status": job["status"], "cancel": outcome or "requested"}
 
 @app.post("/query", response_model=QueryResult)
 async def query(request: QueryRequest):
@@ -93,7 +245,8 @@ async def query(request: QueryRequest):
     file_id = None
     pipeline_used = request.pipeline
     for job in reversed(list(jobs.values())):
-        if job.get("file_id"):
+        # Только готовые: у ожидающих в очереди, отменённых и упавших задач индекса нет
+        if job.get("file_id") and job.get("status") == "ready":
             if job["pipeline"] == request.pipeline:
                 file_id = job["file_id"]
                 pipeline_used = job["pipeline"]
@@ -102,25 +255,42 @@ async def query(request: QueryRequest):
             if file_id is None:
                 file_id = job["file_id"]
                 pipeline_used = job["pipeline"]
+    if not file_id and INGEST_MODE == "queue":
+        # Документы обработали воркеры — их результаты только в durable-очереди
+        latest = await asyncio.to_thread(durable_queue.latest_ready, request.pipeline)
+        if latest:
+            file_id, pipeline_used = latest["file_id"], latest["pipeline"]
     if not file_id:
         raise HTTPException(status_code=404, detail="Нет обработанных файлов")
-    # Загружаем индекс и markdown-фрагменты (используем подтверждённый pipeline_used)
-    index, passages = load_faiss_index(file_id, pipeline_used)
-    # Получаем эмбеддинг вопроса
-    query_emb = get_embeddings([request.question])[0]
-    # Поиск top_k
-    top_pairs, passages_list = search_faiss_index(file_id, pipeline_used, query_emb, request.top_k)
-    top_passages = [passages_list[i] for i, _ in top_pairs]
-    # LLM
-    prompt = build_prompt(top_passages, request.question)
-    llm_response = ask_llm(prompt)
+    query_id = str(uuid.uuid4())
+    with start_trace("query", query_id=query_id, file_id=file_id, pipeline=pipeline_used, top_k=request.top_k) as root:
+        try:
+            # Загружаем индекс и markdown-фрагменты (используем подтверждённый pipeline_used)
+            with span("load"):
+                index, passages = load_faiss_index(file_id, pipeline_used)
+            # Получаем эмбеддинг вопроса той же размерности, что и индекс документа
+            # Сетевые вызовы — в потоке, чтобы не блокировать event loop; вопрос идёт вне очереди загрузок
+            with span("embed"):
+                query_emb = (await asyncio.to_thread(
+                    get_embeddings, [request.question], index.d, PRIORITY_QUERY))[0]
+            # Поиск top_k
+            with span("search"):
+                top_pairs, passages_list = search_faiss_index(file_id, pipeline_used, query_emb, request.top_k)
+            top_passages = [passages_list[i] for i, _ in top_pairs]
+            # LLM
+            with span("prompt", passages=len(top_passages)):
+                prompt = build_prompt(top_passages, request.question)
+            with span("llm", prompt_chars=len(prompt)):
+                llm_response = await asyncio.to_thread(ask_llm, prompt)
+        finally:
+            _store_query_trace(query_id, root)
     answer = llm_response.strip()
-    return QueryResult(answer=answer, passages=top_passages)
+    return QueryResult(answer=answer, passages=top_passages, query_id=query_id)
 
 @app.get("/download-markdown/{job_id}")
 async def download_markdown(job_id: str):
     """Return the converted Markdown file for the specified job as a file download."""
-    job = jobs.get(job_id)
+    job = await _find_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Задача не найдена")
     file_id = job.get("file_id")
@@ -131,17 +301,82 @@ async def download_markdown(job_id: str):
         raise HTTPException(status_code=404, detail="Markdown-файл не найден")
     return FileResponse(md_path, filename=f"{file_id}.md", media_type="text/markdown")
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: процесс жив и обслуживает event loop."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: токенизатор, конвертеры, OpenAI-клиент и индексы прогреты."""
+    ready = warmup.is_ready()
+    if ready:
+        status = "ready"
+    elif any(state.startswith("error") for state in warmup.readiness.values()):
+        status = "not_ready"
+    else:
+        status = "warming_up"
+    return JSONResponse(status_code=200 if ready else 503, content={"status": status, "checks": warmup.readiness})
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в формате Prometheus (text exposition)."""
+    # Gauge'и считаются при генерации (в режиме queue — запросом к SQLite), поэтому не в event loop
+    data, content_type = await asyncio.to_thread(render_metrics)
+    return Response(content=data, media_type=content_type)
+
 # ==== Background tasks ====
 
-async def process_file_job(job_id, orig_path, file_id, pipeline):
-    try:
-        logger.info("[process_file_job] Start job %s (file_id=%s)", job_id, file_id)
-        jobs[job_id]["status"] = "converting"
-        _update_job(job_id, progress=0.1, detail="Загрузка файла")
-        md_path = os.path.join("data", "markdown", f"{file_id}.md")
-        # Определяем расширение исходного файла
-        ext = os.path.splitext(orig_path)[1].lower().lstrip(".")
+def _store_query_trace(query_id: str, root):
+    query_traces[query_id] = root
+    while len(query_traces) > QUERY_TRACE_LIMIT:
+        query_traces.popitem(last=False)
 
+@contextmanager
+def _job_context(job_id: str, name: str):
+    """Корневой span и флаг отмены задачи; при profile_requested — ещё и cProfile по стадиям."""
+    job = jobs[job_id]
+    if job.get("profile_requested"):
+        job["profiler"] = JobProfiler()
+    cancel_event = job.setdefault("cancel_event", threading.Event())
+    with cancel_scope(cancel_event), start_trace(name, job_id=job_id, pipeline=job.get("pipeline")) as root:
+        job["trace"] = root
+        try:
+            yield root
+        finally:
+            profiler = job.pop("profiler", None)
+            if profiler is not None:
+                job["profile"] = profiler.dump(os.path.join(TRACE_DIR, f"{job_id}.prof"))
+
+def _trace_path(job_id: str) -> str:
+    return os.path.join(TRACE_DIR, f"{job_id}.json")
+
+def _mark_cancelled(job_id: str):
+    logger.info("[job %s] Cancelled", job_id)
+    jobs[job_id]["status"] = "cancelled"
+    _update_job(job_id, detail="Задача отменена")
+
+def _call_stage(job_id: str, fn, *args):
+    """Вызывает стадию (с проверкой отмены) под профилировщиком задачи, если он включён."""
+    raise_if_cancelled()
+    profiler = jobs[job_id].get("profiler")
+    return profiler.call(fn, *args) if profiler is not None else fn(*args)
+
+def _read_markdown(md_path: str) -> str:
+    with open(md_path, encoding="utf-8") as f:
+        return f.read()
+
+async def _ingest_file(job_id: str, orig_path: str, file_id: str, pipeline: str,
+                       on_stage: Optional[Callable[[float, str], None]] = None) -> str:
+    """Конвертация → чтение → чанкинг → эмбеддинги → индекс для одного файла. Возвращает реальный pipeline."""
+    def stage(progress: float, detail: str):
+        if on_stage is not None:
+            on_stage(progress, detail)
+
+    md_path = os.path.join("data", "markdown", f"{file_id}.md")
+    # Определяем расширение исходного файла
+    ext = os.path.splitext(orig_path)[1].lower().lstrip(".")
+    with span("convert", ext=ext) as sp:
         # Если уже Markdown — пропускаем конвертацию
         if ext == "md":
             # Убедимся, что директория существует
@@ -149,71 +384,90 @@ async def process_file_job(job_id, orig_path, file_id, pipeline):
             shutil.copyfile(orig_path, md_path)
             real_pipeline = "markdown"
         else:
-            _update_job(job_id, progress=0.2, detail="DocLing/Markitdown: конвертация")
+            stage(0.2, "DocLing/Markitdown: конвертация")
             # Конвертация в зависимости от выбранного pipeline
-            real_pipeline = await asyncio.to_thread(convert_to_markdown, orig_path, md_path, pipeline)
-        _update_job(job_id, progress=0.3, detail="Конвертация в Markdown")
-        logger.debug("[process_file_job] Converted to markdown via %s: %s", real_pipeline, md_path)
-        # Чтение markdown
-        with open(md_path, encoding="utf-8") as f:
-            md_text = f.read()
-        # Чанкинг
-        chunks = chunk_markdown(md_text)
-        _update_job(job_id, progress=0.5, detail="Чанкинг Markdown")
-        logger.debug("[process_file_job] Markdown chunked into %d chunks", len(chunks))
-        # Эмбеддинги
-        embeddings = await asyncio.to_thread(get_embeddings, chunks)
-        _update_job(job_id, progress=0.7, detail="Вычисление эмбеддингов и индексация")
-        logger.debug("[process_file_job] Created embeddings and index")
-        # Индексация
-        create_faiss_index(embeddings, chunks, file_id, real_pipeline)
-        _update_job(job_id, progress=1.0, detail=f"Готово — pipeline: {real_pipeline}")
-        jobs[job_id]["status"] = "ready"
-    except Exception as e:
-        logger.exception("[process_file_job] Job %s failed", job_id)
-        jobs[job_id]["status"] = "error"
-        _update_job(job_id, detail=str(e))
+            real_pipeline = await asyncio.to_thread(_call_stage, job_id, convert_to_markdown, orig_path, md_path, pipeline)
+        if sp is not None:
+            sp.attrs["pipeline"] = real_pipeline
+    stage(0.3, "Конвертация в Markdown")
+    logger.debug("[job %s] Converted to markdown via %s: %s", job_id, real_pipeline, md_path)
+    # Чтение markdown
+    with span("read"):
+        md_text = _call_stage(job_id, _read_markdown, md_path)
+    # Чанкинг
+    with span("chunk", chars=len(md_text)) as sp:
+        chunks = _call_stage(job_id, chunk_markdown, md_text)
+        if sp is not None:
+            sp.attrs["chunks"] = len(chunks)
+    stage(0.5, "Чанкинг Markdown")
+    logger.debug("[job %s] Markdown chunked into %d chunks", job_id, len(chunks))
+    # Эмбеддинги
+    with span("embed", chunks=len(chunks)):
+        embeddings = await asyncio.to_thread(_call_stage, job_id, get_embeddings, chunks)
+    stage(0.7, "Вычисление эмбеддингов и индексация")
+    # Индексация
+    with span("index_write"):
+        _call_stage(job_id, create_faiss_index, embeddings, chunks, file_id, real_pipeline)
+    logger.debug("[job %s] Created embeddings and index", job_id)
+    return real_pipeline
+
+async def process_file_job(job_id, orig_path, file_id, pipeline):
+    with _job_context(job_id, "file_job"):
+        try:
+            logger.info("[process_file_job] Start job %s (file_id=%s)", job_id, file_id)
+            jobs[job_id]["status"] = "converting"
+            _update_job(job_id, progress=0.1, detail="Загрузка файла")
+            real_pipeline = await _ingest_file(
+                job_id, orig_path, file_id, pipeline,
+                on_stage=lambda progress, detail: _update_job(job_id, progress=progress, detail=detail),
+            )
+            _update_job(job_id, progress=1.0, detail=f"Готово — pipeline: {real_pipeline}")
+            jobs[job_id]["status"] = "ready"
+        except JobCancelled:
+            _mark_cancelled(job_id)
+        except Exception as e:
+            logger.exception("[process_file_job] Job %s failed", job_id)
+            jobs[job_id]["status"] = "error"
+            _update_job(job_id, detail=str(e))
 
 async def process_zip_job(job_id, pdfs, pipeline):
-    try:
-        logger.info("[process_zip_job] Start zip job %s with %d pdfs", job_id, len(pdfs))
-        count = len(pdfs)
-        for idx, (name, pdf_bytes) in enumerate(pdfs):
-            file_id, orig_path = save_original_file(pdf_bytes, "pdf")
-            md_path = os.path.join("data", "markdown", f"{file_id}.md")
-            real_pipeline = await asyncio.to_thread(convert_to_markdown, orig_path, md_path, pipeline)
-            with open(md_path, encoding="utf-8") as f:
-                md_text = f.read()
-            chunks = chunk_markdown(md_text)
-            embeddings = await asyncio.to_thread(get_embeddings, chunks)
-            create_faiss_index(embeddings, chunks, file_id, real_pipeline)
-            jobs[job_id]["file_ids"].append(file_id)
-            jobs[job_id]["done"] += 1
-            _update_job(job_id, progress=jobs[job_id]["done"] / count, detail=f"Обработка файла {idx+1}/{count}")
-            logger.debug("[process_zip_job] Processed file %s (%d/%d)", file_id, idx+1, count)
-        _update_job(job_id, progress=1.0, detail=f"Готово — обработано файлов: {count}")
-        jobs[job_id]["status"] = "ready"
-    except Exception as e:
-        logger.exception("[process_zip_job] Job %s failed", job_id)
-        jobs[job_id]["status"] = "error"
-        _update_job(job_id, detail=str(e))
+    with _job_context(job_id, "zip_job"):
+        try:
+            logger.info("[process_zip_job] Start zip job %s with %d pdfs", job_id, len(pdfs))
+            jobs[job_id]["status"] = "converting"
+            count = len(pdfs)
+            for idx, (name, pdf_bytes) in enumerate(pdfs):
+                raise_if_cancelled()
+                with span("file", filename=name, index=idx):
+                    with span("save_original"):
+                        file_id, orig_path = save_original_file(pdf_bytes, "pdf")
+                    await _ingest_file(job_id, orig_path, file_id, pipeline)
+                jobs[job_id]["file_ids"].append(file_id)
+                jobs[job_id]["done"] += 1
+                _update_job(job_id, progress=jobs[job_id]["done"] / count, detail=f"Обработка файла {idx+1}/{count}")
+                logger.debug("[process_zip_job] Processed file %s (%d/%d)", file_id, idx+1, count)
+            _update_job(job_id, progress=1.0, detail=f"Готово — обработано файлов: {count}")
+            jobs[job_id]["status"] = "ready"
+        except JobCancelled:
+            _mark_cancelled(job_id)
+        except Exception as e:
+            logger.exception("[process_zip_job] Job %s failed", job_id)
+            jobs[job_id]["status"] = "error"
+            _update_job(job_id, detail=str(e))
 
 # === New endpoint: upload multiple individual files ===
 
 @app.post("/upload-files", response_model=UploadResponse)
-async def upload_files(background_tasks: BackgroundTasks,
-                       files: List[UploadFile] = File(...),
+async def upload_files(files: List[UploadFile] = File(...),
                        pipeline: str = Form("docling"),
-                       project: str = Form("default")):
+                       project: str = Form("default"),
+                       profile: bool = Form(False)):
     if not files:
         raise HTTPException(status_code=400, detail="Файлы не переданы")
     for f in files:
         if not allowed_ext(f.filename):
             raise HTTPException(status_code=400, detail=f"Недопустимый тип файла: {f.filename}")
 
-    job_id = str(uuid.uuid4())
-    jobs[job_id] = {"status": "pending", "progress": 0.0, "detail": None, "count": len(files), "done": 0, "file_ids": [], "pipeline": pipeline, "project": project}
-
     # Считываем содержимое файлов до закрытия соединения, чтобы избежать 'I/O operation on closed file'
     file_buffers = []  # list of tuples (bytes, ext)
     for f in files:
@@ -221,36 +475,69 @@ async def upload_files(background_tasks: BackgroundTasks,
         ext = f.filename.split(".")[-1].lower()
         file_buffers.append((file_bytes, ext))
 
-    async def _process_batch():
+    if INGEST_MODE == "queue":
+        saved = [(f.filename, *save_original_file(file_bytes, ext)) for f, (file_bytes, ext) in zip(files, file_buffers)]
+        return await _enqueue_durable(PRIORITY_BATCH, saved, pipeline, project, profile)
+    job_id = _new_job(count=len(files), done=0, file_ids=[], pipeline=pipeline, project=project, profile_requested=profile)
+    _enqueue(job_id, PRIORITY_BATCH, lambda: process_files_job(job_id, file_buffers, pipeline))
+    return UploadResponse(job_id=job_id)
+
+async def process_files_job(job_id, file_buffers, pipeline):
+    with _job_context(job_id, "batch_job"):
         try:
+            jobs[job_id]["status"] = "converting"
             total = len(file_buffers)
             for idx, (file_bytes, ext) in enumerate(file_buffers):
-                fid, orig_path = save_original_file(file_bytes, ext)
-                md_path = os.path.join("data", "markdown", f"{fid}.md")
-                real_pipeline = await asyncio.to_thread(convert_to_markdown, orig_path, md_path, pipeline)
-                with open(md_path, encoding="utf-8") as fp:
-                    md_text = fp.read()
-                chunks = chunk_markdown(md_text)
-                embeddings = await asyncio.to_thread(get_embeddings, chunks)
-                create_faiss_index(embeddings, chunks, fid, real_pipeline)
+                raise_if_cancelled()
+                with span("file", index=idx, ext=ext):
+                    with span("save_original"):
+                        fid, orig_path = save_original_file(file_bytes, ext)
+                    await _ingest_file(job_id, orig_path, fid, pipeline)
                 jobs[job_id]["file_ids"].append(fid)
                 jobs[job_id]["done"] += 1
                 _update_job(job_id, progress=jobs[job_id]["done"] / total, detail=f"Обработка файла {idx+1}/{total}")
             jobs[job_id]["status"] = "ready"
             _update_job(job_id, progress=1.0, detail="Готово")
+        except JobCancelled:
+            _mark_cancelled(job_id)
         except Exception as e:
             logger.exception("[upload_files] batch failed")
             jobs[job_id]["status"] = "error"
             _update_job(job_id, detail=str(e))
 
-    background_tasks.add_task(_process_batch)
-    return UploadResponse(job_id=job_id)
+async def process_saved_files_job(job_id, files, pipeline):
+    """Задача из durable-очереди: оригиналы уже сохранены API, files — [(name, file_id, path)]."""
+    with _job_context(job_id, "queued_job"):
+        try:
+            logger.info("[process_saved_files_job] Start job %s with %d file(s)", job_id, len(files))
+            jobs[job_id]["status"] = "converting"
+            total = len(files)
+            on_stage = None
+            if total == 1:
+                # Задача /upload-file: прогресс по стадиям, как в process_file_job
+                _update_job(job_id, progress=0.1, detail="Загрузка файла")
+                on_stage = lambda progress, detail: _update_job(job_id, progress=progress, detail=detail)
+            for idx, (name, fid, orig_path) in enumerate(files):
+                raise_if_cancelled()
+                with span("file", filename=name, index=idx):
+                    await _ingest_file(job_id, orig_path, fid, pipeline, on_stage=on_stage)
+                jobs[job_id]["file_ids"].append(fid)
+                jobs[job_id]["done"] += 1
+                _update_job(job_id, progress=jobs[job_id]["done"] / total, detail=f"Обработка файла {idx+1}/{total}")
+            _update_job(job_id, progress=1.0, detail=f"Готово — обработано файлов: {total}")
+            jobs[job_id]["status"] = "ready"
+        except JobCancelled:
+            _mark_cancelled(job_id)
+        except Exception as e:
+            logger.exception("[process_saved_files_job] Job %s failed", job_id)
+            jobs[job_id]["status"] = "error"
+            _update_job(job_id, detail=str(e))
 
 # === Download bundle ===
 
 @app.get("/download-bundle/{job_id}")
 async def download_bundle(job_id: str):
-    job = jobs.get(job_id)
+    job = await _find_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Задача не найдена")
     file_ids = job.get("file_ids", [])
@@ -258,4 +545,29 @@ async def download_bundle(job_id: str):
         raise HTTPException(status_code=400, detail="У задачи нет файлов")
     project = job.get("project", "project")
     zip_path = _zip_markdown(file_ids, project)
-    return FileResponse(zip_path, filename=f"{project}.zip", media_type="application/zip") 
\ No newline at end of file
+    return FileResponse(zip_path, filename=f"{project}.zip", media_type="application/zip") 
+
+# === Traces ===
+
+@app.get("/jobs/{job_id}/trace")
+async def job_trace(job_id: str):
+    """Дерево span'ов задачи (тайминги стадий) и, если запрошено, сводка профиля."""
+    job = await _find_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    root = job.get("trace")
+    if root is not None:
+        return {"job_id": job_id, "status": job["status"], "trace": root.to_dict(), "profile": job.get("profile")}
+    # Задачи из durable-очереди: трассу пишет воркер
+    saved = _trace_path(job_id)
+    if not os.path.exists(saved):
+        raise HTTPException(status_code=404, detail="Трасса ещё не записана")
+    with open(saved, encoding="utf-8") as f:
+        return {"job_id": job_id, "status": job["status"], **json.load(f)}
+
+@app.get("/queries/{query_id}/trace")
+async def query_trace(query_id: str):
+    root = query_traces.get(query_id)
+    if root is None:
+        raise HTTPException(status_code=404, detail="Трасса запроса не найдена")
+    return {"query_id": query_id, "trace": root.to_dict()}
@@ -5,9 +5,10 @@ class UploadResponse(BaseModel):
     job_id: str = Field(..., description="ID фоновой задачи")
 
 class JobStatusResponse(BaseModel):
-    status: Literal["pending", "converting", "embedding", "ready", "error"]
+    status: Literal["pending", "queued", "converting", "embedding", "ready", "error", "cancelled"]
     progress: float = Field(..., description="Прогресс выполнения (0-1)")
     detail: Optional[str] = None
+    queue_position: Optional[int] = None  # 1 — следующая на запуск (только для queued)
 
 class QueryRequest(BaseModel):
     question: str
@@ -16,4 +17,5 @@ class QueryRequest(BaseModel):
 
 class QueryResult(BaseModel):
     answer: str            # Текстовый ответ LLM
-    passages: List[str]   # Markdown-фрагменты, использованные для ответа 
\ No newline at end of file
+    passages: List[str]   # Markdown-фрагменты, использованные для ответа
+    query_id: Optional[str] = None  # ID для /queries/{query_id}/trace 
\ No newline at end of file
@@ -2,8 +2,13 @@ import os
 import tempfile
 import subprocess
 import logging
+import queue
+import threading
+from contextlib import contextmanager
 from typing import Literal
 import time
+from backend.utils.metrics import CONVERTER_SECONDS, CONVERTER_CLI_FALLBACKS, CONVERSION_SECONDS, CONVERSION_FALLBACKS
+from backend.utils.job_queue import MAX_CONCURRENT_JOBS, JobCancelled, cancel_requested, raise_if_cancelled
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +22,110 @@ def _write_markdown(md_text: str, output_path: str):
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(md_text)
 
+# Helper: запуск CLI-конвертера, который можно прервать отменой задачи
+def _run_cli(cmd: list, timeout: float = 60) -> subprocess.CompletedProcess:
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            stdout, stderr = proc.communicate(timeout=0.5)
+            return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+        except subprocess.TimeoutExpired:
+            if cancel_requested() or time.monotonic() > deadline:
+                proc.kill()
+                proc.communicate()
+                raise_if_cancelled()
+                raise subprocess.TimeoutExpired(cmd, timeout)
+
 # Конвертация через DocLing
 
+# DocumentConverter дорогой: при первом convert он грузит модели layout/OCR, и
+# создавать его на каждый файл — платить за это каждый раз. Потокобезопасность
+# одного экземпляра не гарантирована, поэтому держим пул: по конвертеру на каждую
+# одновременную задачу (MAX_CONCURRENT_JOBS в API, --concurrency у воркера).
+DOCLING_CONVERTERS = int(os.getenv("DOCLING_CONVERTERS", str(MAX_CONCURRENT_JOBS)))
+
+class _ConverterPool:
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._idle: "queue.Queue" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def resize(self, size: int):
+        with self._lock:
+            self.size = max(1, size)
+
+    def _reserve(self) -> bool:
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return True
+            return False
+
+    def _create(self):
+        from docling.document_converter import DocumentConverter  # type: ignore
+
+        try:
+            return DocumentConverter()
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def acquire(self):
+        """Свободный конвертер; пока все заняты — ждёт, проверяя отмену задачи."""
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            if self._reserve():
+                return self._create()
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                raise_if_cancelled()
+
+    def release(self, converter):
+        self._idle.put(converter)
+
+    def fill(self) -> int:
+        """Создаёт недостающие конвертеры и загружает в каждом PDF-pipeline (прогрев)."""
+        from docling.datamodel.base_models import InputFormat  # type: ignore
+
+        converters = []
+        try:
+            while self._reserve():
+                converters.append(self._create())
+            while not self._idle.empty():
+                converters.append(self._idle.get_nowait())
+            for converter in converters:
+                converter.initialize_pipeline(InputFormat.PDF)
+        finally:
+            for converter in converters:
+                self.release(converter)
+        return len(converters)
+
+_docling_pool = _ConverterPool(DOCLING_CONVERTERS)
+
+def configure_docling_pool(size: int):
+    """Размер пула под число одновременных задач процесса (воркер задаёт его по --concurrency)."""
+    _docling_pool.resize(size)
+
+def warm_docling_converters() -> int:
+    return _docling_pool.fill()
+
+@contextmanager
+def docling_converter():
+    converter = _docling_pool.acquire()
+    try:
+        # Пока задача ждала конвертер, её могли отменить
+        raise_if_cancelled()
+        yield converter
+    finally:
+        _docling_pool.release(converter)
+
 def convert_with_docling(input_path: str, output_path: str) -> bool:
     """
     Преобразует документ в Markdown через библиотеку DocLing. Сначала
@@ -26,29 +133,35 @@ def convert_with_docling(input_path: str, output_path: str) -> bool:
     откатывается к CLI-команде `docling convert`.
     """
     # 1) Пробуем Python-API
+    start = time.perf_counter()
     try:
-        from docling.document_converter import DocumentConverter  # type: ignore
-
-        converter = DocumentConverter()
-        result = converter.convert(input_path)
+        with docling_converter() as converter:
+            result = converter.convert(input_path)
         md_str = result.document.export_to_markdown()
         _write_markdown(md_str, output_path)
+        CONVERTER_SECONDS.labels("docling", "api", "ok").observe(time.perf_counter() - start)
         return True
+    except JobCancelled:
+        raise
     except Exception as e:
+        CONVERTER_SECONDS.labels("docling", "api", "error").observe(time.perf_counter() - start)
         logger.warning("[DocLing] Python API failed: %s", e, exc_info=True)
 
     # 2) Фолбэк: CLI
+    raise_if_cancelled()
+    CONVERTER_CLI_FALLBACKS.labels("docling").inc()
+    start = time.perf_counter()
     try:
-        result = subprocess.run(
-            ["docling", "convert", input_path, "-o", output_path],
-            capture_output=True,
-            text=True,
-            timeout=60,
-        )
+        result = _run_cli(["docling", "convert", input_path, "-o", output_path], timeout=60)
         if result.returncode != 0:
             logger.warning("[DocLing CLI] stderr:\n%s", result.stderr)
+        outcome = "ok" if result.returncode == 0 else "error"
+        CONVERTER_SECONDS.labels("docling", "cli", outcome).observe(time.perf_counter() - start)
         return result.returncode == 0
+    except JobCancelled:
+        raise
     except Exception as e:
+        CONVERTER_SECONDS.labels("docling", "cli", "error").observe(time.perf_counter() - start)
         logger.warning("[DocLing CLI] Exception: %s", e, exc_info=True)
         return False
 
@@ -70,25 +183,31 @@ def convert_with_markitdown(input_path: str, output_path: str) -> bool:
         md_str = result.text_content
         _write_markdown(md_str, output_path)
         logger.info("[MarkItDown] Python API finished in %.2f sec", time.time() - start)
+        CONVERTER_SECONDS.labels("markitdown", "api", "ok").observe(time.time() - start)
         return True
     except Exception as e:
+        CONVERTER_SECONDS.labels("markitdown", "api", "error").observe(time.time() - start)
         logger.warning("[MarkItDown] Python API failed: %s", e, exc_info=True)
 
     # 2) CLI fallback
+    raise_if_cancelled()
+    CONVERTER_CLI_FALLBACKS.labels("markitdown").inc()
+    start = time.time()
     try:
         logger.info("[MarkItDown CLI] Running markitdown %s -o %s", input_path, output_path)
-        result = subprocess.run(
-            ["markitdown", input_path, "-o", output_path],
-            capture_output=True,
-            text=True,
-            timeout=60,
-        )
+        result = _run_cli(["markitdown", input_path, "-o", output_path], timeout=60)
+        elapsed = time.time() - start
         if result.returncode != 0:
             logger.warning("[MarkItDown CLI] stderr:\n%s", result.stderr)
         else:
-            logger.info("[MarkItDown CLI] Finished in %.2f sec", result.elapsed.total_seconds() if hasattr(result, "elapsed") else 0)
+            logger.info("[MarkItDown CLI] Finished in %.2f sec", elapsed)
+        outcome = "ok" if result.returncode == 0 else "error"
+        CONVERTER_SECONDS.labels("markitdown", "cli", outcome).observe(elapsed)
         return result.returncode == 0
+    except JobCancelled:
+        raise
     except Exception as e:
+        CONVERTER_SECONDS.labels("markitdown", "cli", "error").observe(time.time() - start)
         logger.warning("[MarkItDown CLI] Exception: %s", e, exc_info=True)
         return False
 
@@ -101,21 +220,25 @@ def convert_to_markdown(input_path: str, output_path: str, pipeline: Literal["do
     Возвращает имя pipeline, который реально сработал.
     """
     logger.info("[Conversion] Requested pipeline: %s for %s", pipeline, input_path)
-    if pipeline == "markitdown":
-        ok = convert_with_markitdown(input_path, output_path)
-        if ok:
-            return "markitdown"
-        logger.warning("[Conversion] Markitdown не сработал, fallback на DocLing...")
-        ok = convert_with_docling(input_path, output_path)
-        if ok:
-            return "docling"
+    start = time.perf_counter()
+    requested = "markitdown" if pipeline == "markitdown" else "docling"
+    used = "failed"
+    try:
+        if requested == "markitdown":
+            primary, fallback = convert_with_markitdown, convert_with_docling
+            primary_name, fallback_name = "markitdown", "docling"
+        else:
+            primary, fallback = convert_with_docling, convert_with_markitdown
+            primary_name, fallback_name = "docling", "markitdown"
+        if primary(input_path, output_path):
+            used = primary_name
+            return used
+        logger.warning("[Conversion] %s не сработал, fallback на %s...", primary_name, fallback_name)
+        raise_if_cancelled()
+        CONVERSION_FALLBACKS.labels(primary_name, fallback_name).inc()
+        if fallback(input_path, output_path):
+            used = fallback_name
+            return used
         raise RuntimeError("Не удалось конвертировать файл ни одним pipeline")
-    else:
-        ok = convert_with_docling(input_path, output_path)
-        if ok:
-            return "docling"
-        logger.warning("[Conversion] DocLing не сработал, fallback на Markitdown...")
-        ok = convert_with_markitdown(input_path, output_path)
-        if ok:
-            return "markitdown"
-        raise RuntimeError("Не удалось конвертировать файл ни одним pipeline") 
\ No newline at end of file
+    finally:
+        CONVERSION_SECONDS.labels(requested, used).observe(time.perf_counter() - start)
@@ -0,0 +1,262 @@
+"""
+Durable-очередь задач загрузки в SQLite (по умолчанию data/queue.sqlite).
+
+Используется при INGEST_MODE=queue: API только ставит задачи, выполняют их
+процессы `python -m backend.worker` (в том числе на других машинах с общим
+каталогом data/). Воркер забирает задачу атомарно (BEGIN IMMEDIATE) с
+арендой на JOB_LEASE_SECONDS и продлевает её heartbeat'ом, заодно
+записывая прогресс. Задача с истёкшей арендой (воркер упал или завис)
+достаётся следующему воркеру, пока не исчерпано JOB_MAX_ATTEMPTS попыток.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from backend.utils.job_queue import QueueFull
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DB_PATH = os.getenv("QUEUE_DB_PATH", os.path.join("data", "queue.sqlite"))
+# WAL быстрее, но требует общей памяти; для тома, смонтированного по сети, — DELETE
+QUEUE_DB_JOURNAL = os.getenv("QUEUE_DB_JOURNAL", "WAL")
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "30"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id               TEXT PRIMARY KEY,
+    priority         INTEGER NOT NULL,
+    payload          TEXT NOT NULL,
+    project          TEXT,
+    pipeline         TEXT,
+    file_id          TEXT,
+    status           TEXT NOT NULL,
+    stage            TEXT,
+    progress         REAL NOT NULL DEFAULT 0,
+    detail           TEXT,
+    file_ids         TEXT NOT NULL DEFAULT '[]',
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    max_attempts     INTEGER NOT NULL,
+    lease_owner      TEXT,
+    lease_expires    REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created          REAL NOT NULL,
+    updated          REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_priority ON jobs (status, priority, created);
+"""
+
+# Колонки, добавленные после первой версии схемы (ALTER для уже созданных баз)
+_MIGRATIONS = {
+    "file_id": "ALTER TABLE jobs ADD COLUMN file_id TEXT",
+}
+
+_FINAL_STATUSES = ("ready", "error", "cancelled")
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def _connect(path: Optional[str] = None) -> sqlite3.Connection:
+    path = path or QUEUE_DB_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if path not in _initialized:
+        with _init_lock:
+            if path not in _initialized:
+                conn.execute(f"PRAGMA journal_mode={QUEUE_DB_JOURNAL}")
+                conn.executescript(_SCHEMA)
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+                for column, ddl in _MIGRATIONS.items():
+                    if column not in columns:
+                        conn.execute(ddl)
+                _initialized.add(path)
+    return conn
+
+
+@contextmanager
+def _transaction(immediate: bool = True):
+    """Транзакция на отдельном соединении; BEGIN IMMEDIATE сразу берёт блокировку записи."""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def _queued_count(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+
+# ---------- API-сторона ----------
+
+def enqueue(job_id: str, priority: int, payload: Dict, *, project: str, pipeline: str,
+            file_id: Optional[str] = None, max_queued: Optional[int] = None, max_attempts: int = JOB_MAX_ATTEMPTS):
+    """Ставит задачу в очередь; QueueFull, если в ней уже max_queued ожидающих.
+
+    `file_id` — только у задач /upload-file (как и в записях `jobs` backend.main): по нему /query
+    находит последний обработанный документ.
+    """
+    now = time.time()
+    with _transaction() as conn:
+        if max_queued is not None and _queued_count(conn) >= max_queued:
+            raise QueueFull()
+        conn.execute(
+            "INSERT INTO jobs (id, priority, payload, project, pipeline, file_id, status, max_attempts, created, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, priority, json.dumps(payload, ensure_ascii=False), project, pipeline, file_id,
+             max_attempts, now, now),
+        )
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """Статус задачи в формате записей `jobs` из backend.main (+ queue_position)."""
+    with _transaction(immediate=False) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        position = None
+        if row["status"] == "queued":
+            position = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority < ? OR (priority = ? AND created <= ?))",
+                (row["priority"], row["priority"], row["created"]),
+            ).fetchone()[0]
+    return {
+        # Пока задача в аренде, для клиента важна стадия (converting/embedding)
+        "status": (row["stage"] or "converting") if row["status"] == "running" else row["status"],
+        "progress": row["progress"],
+        "detail": row["detail"],
+        "file_id": row["file_id"],
+        "file_ids": json.loads(row["file_ids"]),
+        "project": row["project"],
+        "pipeline": row["pipeline"],
+        "attempts": row["attempts"],
+        "queue_position": position,
+    }
+
+
+def latest_ready(pipeline: str) -> Optional[Dict]:
+    """Последний готовый однофайловый документ: сначала с тем же pipeline, иначе любой."""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT file_id, pipeline FROM jobs WHERE status = 'ready' AND file_id IS NOT NULL"
+            " ORDER BY pipeline = ? DESC, updated DESC LIMIT 1",
+            (pipeline,),
+        ).fetchone()
+    finally:
+        conn.close()
+    return {"file_id": row["file_id"], "pipeline": row["pipeline"]} if row else None
+
+
+def cancel(job_id: str) -> Optional[str]:
+    """Ожидающую задачу отменяет сразу ("dequeued"), выполняющейся выставляет флаг ("cancelling")."""
+    with _transaction() as conn:
+        row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["status"] in _FINAL_STATUSES:
+            return None
+        if row["status"] == "queued":
+            conn.execute("UPDATE jobs SET status = 'cancelled', detail = 'Задача отменена до запуска', updated = ?"
+                         " WHERE id = ?", (time.time(), job_id))
+            return "dequeued"
+        conn.execute("UPDATE jobs SET cancel_requested = 1, updated = ? WHERE id = ?", (time.time(), job_id))
+        return "cancelling"
+
+
+def counts() -> Dict[str, int]:
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+    finally:
+        conn.close()
+    return {status: n for status, n in rows}
+
+
+# ---------- Сторона воркера ----------
+
+def claim(worker_id: str, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[Dict]:
+    """Забирает следующую задачу: ожидающую или брошенную (аренда истекла)."""
+    now = time.time()
+    with _transaction() as conn:
+        _reap_abandoned(conn, now)
+        row = conn.execute(
+            "SELECT id, payload, attempts, status FROM jobs"
+            " WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?)"
+            " ORDER BY priority, created LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row is None:
+            return None
+        if row["status"] == "running":
+            logger.warning("[durable_queue] Job %s lease expired, retrying (attempt %d)", row["id"], row["attempts"] + 1)
+        conn.execute(
+            "UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?, attempts = attempts + 1,"
+            " stage = NULL, progress = 0, file_ids = '[]', updated = ? WHERE id = ?",
+            (worker_id, now + lease_seconds, now, row["id"]),
+        )
+    return {"id": row["id"], "payload": json.loads(row["payload"]), "attempt": row["attempts"] + 1}
+
+
+def _reap_abandoned(conn: sqlite3.Connection, now: float):
+    """Брошенные задачи, которые повторять не нужно: отменённые или исчерпавшие попытки."""
+    conn.execute(
+        "UPDATE jobs SET status = 'cancelled', detail = 'Задача отменена', lease_owner = NULL, updated = ?"
+        " WHERE status = 'running' AND lease_expires < ? AND cancel_requested = 1",
+        (now, now),
+    )
+    conn.execute(
+        "UPDATE jobs SET status = 'error', detail = 'Воркер не завершил задачу за ' || attempts || ' попыток',"
+        " lease_owner = NULL, updated = ?"
+        " WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+        (now, now),
+    )
+
+
+def heartbeat(job_id: str, worker_id: str, *, stage: str, progress: float, detail: Optional[str],
+              file_ids: List[str], lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[bool]:
+    """Продлевает аренду и пишет прогресс. Возвращает флаг отмены или None, если аренда потеряна."""
+    now = time.time()
+    with _transaction() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET lease_expires = ?, stage = ?, progress = ?, detail = ?, file_ids = ?, updated = ?"
+            " WHERE id = ? AND status = 'running' AND lease_owner = ?",
+            (now + lease_seconds, stage, progress, detail, json.dumps(file_ids), now, job_id, worker_id),
+        )
+        if cur.rowcount == 0:
+            return None
+        return bool(conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()[0])
+
+
+def finish(job_id: str, worker_id: str, *, status: str, progress: float, detail: Optional[str],
+           file_ids: List[str]) -> bool:
+    """Записывает итог задачи, если аренда всё ещё у этого воркера."""
+    with _transaction() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET status = ?, stage = NULL, progress = ?, detail = ?, file_ids = ?, lease_owner = NULL,"
+            " lease_expires = NULL, updated = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+            (status, progress, detail, json.dumps(file_ids), time.time(), job_id, worker_id),
+        )
+        return cur.rowcount > 0
+
+
+def release(job_id: str, worker_id: str) -> bool:
+    """Возвращает недоделанную задачу в очередь (остановка воркера); попытка не засчитывается."""
+    with _transaction() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'queued', attempts = attempts - 1, lease_owner = NULL, lease_expires = NULL,"
+            " updated = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+            (time.time(), job_id, worker_id),
+        )
+        return cur.rowcount > 0
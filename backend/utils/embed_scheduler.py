@@ -0,0 +1,310 @@
+"""
+Общий на процесс диспетчер запросов к embeddings API.
+
+Все задачи и `/query` ставят тексты в одну очередь с приоритетами
+(запросы пользователей впереди фоновой загрузки). Диспетчер собирает из
+очереди полные батчи (до EMBED_BATCH_SIZE входов / EMBED_BATCH_MAX_TOKENS
+токенов), соблюдает бюджет EMBED_TPM_LIMIT / EMBED_RPM_LIMIT и при 429
+приостанавливает отправку для всех, а не для одного вызывающего.
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from backend.utils.metrics import (
+    EMBEDDING_BATCH_INPUTS, EMBEDDING_BATCH_TOKENS, EMBEDDING_QUEUE_DEPTH, EMBEDDING_QUEUE_WAIT_SECONDS,
+    EMBEDDING_RATE_LIMITED, EMBEDDING_REQUEST_SECONDS, EMBEDDING_TOKENS,
+)
+from backend.utils.openai_client import get_openai_client
+from backend.utils.tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_QUERY = 0
+PRIORITY_INGEST = 1
+_PRIORITY_NAMES = {PRIORITY_QUERY: "query", PRIORITY_INGEST: "ingest"}
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))  # лимит API — 2048 входов
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "250000"))  # лимит API — 300k
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "25"))  # ожидание добора батча (только ingest)
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))  # одновременных запросов к API
+EMBED_TPM_LIMIT = int(os.getenv("EMBED_TPM_LIMIT", "0"))  # 0 — без ограничения
+EMBED_RPM_LIMIT = int(os.getenv("EMBED_RPM_LIMIT", "0"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+
+class RateBudget:
+    """Token bucket на минутный лимит (ёмкость = лимит, пополнение равномерное)."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        # Батч больше ёмкости пропускаем при полном бюджете, иначе он не уйдёт никогда
+        amount = min(amount, self.capacity)
+        return 0.0 if self.available >= amount else (amount - self.available) / self.rate
+
+    def consume(self, amount: float):
+        if self.capacity > 0:
+            self.available -= min(amount, self.capacity)
+
+
+class _ItemFuture(Future):
+    """Future входа: cancel() помечает сам вход, даже если Future уже RUNNING
+    (вход отправлялся и стоит в очереди на повтор после 429)."""
+
+    def __init__(self, item: "_Item"):
+        super().__init__()
+        self._item = item
+
+    def cancel(self) -> bool:
+        self._item.cancelled = True
+        return super().cancel()
+
+
+class _Item:
+    __slots__ = ("text", "tokens", "dimensions", "priority", "future", "span", "enqueued", "attempts", "cancelled")
+
+    def __init__(self, text: str, tokens: int, dimensions: Optional[int], priority: int, span):
+        self.text = text
+        self.tokens = tokens
+        self.dimensions = dimensions
+        self.priority = priority
+        self.cancelled = False
+        self.future: Future = _ItemFuture(self)
+        self.span = span
+        self.enqueued = time.perf_counter()
+        self.attempts = 0
+
+
+class EmbeddingDispatcher:
+    def __init__(self, model: str, batch_size: int = EMBED_BATCH_SIZE, batch_max_tokens: int = EMBED_BATCH_MAX_TOKENS,
+                 batch_wait_ms: float = EMBED_BATCH_WAIT_MS, concurrency: int = EMBED_CONCURRENCY,
+                 tpm_limit: int = EMBED_TPM_LIMIT, rpm_limit: int = EMBED_RPM_LIMIT,
+                 max_retries: int = EMBED_MAX_RETRIES):
+        self.model = model
+        self.batch_size = batch_size
+        self.batch_max_tokens = batch_max_tokens
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.max_retries = max_retries
+        self._tpm = RateBudget(tpm_limit)
+        self._rpm = RateBudget(rpm_limit)
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        # Один слот всегда оставляем под запросы пользователей, чтобы загрузки не заняли все;
+        # поэтому слотов минимум два, даже при concurrency=1
+        self.ingest_concurrency = max(1, concurrency - 1)
+        self.concurrency = self.ingest_concurrency + 1
+        self._inflight = {PRIORITY_QUERY: 0, PRIORITY_INGEST: 0}
+        self._paused_until = 0.0
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed-request")
+        self._thread = threading.Thread(target=self._run, name="embed-dispatcher", daemon=True)
+        self._thread.start()
+        for prio, name in _PRIORITY_NAMES.items():
+            EMBEDDING_QUEUE_DEPTH.labels(name).set_function(lambda p=prio: self.queued(p))
+
+    # ---------- API ----------
+
+    def submit(self, texts: Sequence[str], tokens: Sequence[int], dimensions: Optional[int],
+               priority: int = PRIORITY_INGEST) -> List[Future]:
+        parent = current_span()
+        items = [_Item(t, n, dimensions, priority, parent) for t, n in zip(texts, tokens)]
+        with self._cond:
+            for item in items:
+                heapq.heappush(self._heap, (priority, next(self._seq), item))
+            self._cond.notify()
+        return [item.future for item in items]
+
+    def queued(self, priority: Optional[int] = None) -> int:
+        with self._cond:
+            return sum(1 for p, _, _ in self._heap if priority is None or p == priority)
+
+    # ---------- Диспетчер ----------
+
+    def _run(self):
+        while True:
+            try:
+                priority, batch = self._next_batch()
+            except Exception:
+                logger.exception("[embed] dispatcher failed to form a batch")
+                time.sleep(0.1)
+                continue
+            self._pool.submit(self._send, priority, batch)
+
+    def _has_slot(self, priority: int) -> bool:
+        if sum(self._inflight.values()) >= self.concurrency:
+            return False
+        return priority == PRIORITY_QUERY or self._inflight[PRIORITY_INGEST] < self.ingest_concurrency
+
+    def _next_batch(self):
+        """Ждёт свободный слот и бюджет и забирает из очереди следующий батч."""
+        with self._cond:
+            while True:
+                self._drop_cancelled()
+                # Батч собирается в последний момент: пришедшие тем временем вопросы попадут в него первыми
+                if not self._heap or not self._has_slot(self._heap[0][0]):
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                head_priority = self._heap[0][0]
+                oldest = min(entry[2].enqueued for entry in self._heap)
+                # Фоновую загрузку немного придерживаем, чтобы батч успел заполниться
+                linger = 0.0 if head_priority == PRIORITY_QUERY else self.batch_wait - (time.perf_counter() - oldest)
+                if linger > 0 and len(self._heap) < self.batch_size:
+                    self._cond.wait(linger)
+                    continue
+                candidate = self._peek_batch()
+                tokens = sum(item.tokens for item in candidate)
+                wait = max(self._paused_until - now, self._rpm.wait_time(1, now), self._tpm.wait_time(tokens, now))
+                if wait > 0:
+                    # Пока ждём бюджет, могут прийти более приоритетные запросы — пересоберём батч
+                    self._cond.wait(wait)
+                    continue
+                self._rpm.consume(1)
+                self._tpm.consume(tokens)
+                self._inflight[head_priority] += 1
+                return head_priority, self._pop_batch(candidate)
+
+    def _drop_cancelled(self):
+        if any(entry[2].cancelled for entry in self._heap):
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+
+    def _peek_batch(self) -> List[_Item]:
+        """Первые по приоритету элементы той же размерности и того же приоритета, что и голова очереди.
+
+        Вопросы не добираются входами загрузки: иначе вопрос ждал бы бюджет TPM под весь чужой батч.
+        """
+        head = self._heap[0][2]
+        batch, tokens = [], 0
+        for entry in sorted(self._heap):
+            item = entry[2]
+            if item.priority != head.priority:
+                break
+            if item.dimensions != head.dimensions:
+                continue
+            if batch and (len(batch) >= self.batch_size or tokens + item.tokens > self.batch_max_tokens):
+                break
+            batch.append(item)
+            tokens += item.tokens
+        return batch
+
+    def _pop_batch(self, batch: List[_Item]) -> List[_Item]:
+        chosen = {id(item) for item in batch}
+        self._heap = [entry for entry in self._heap if id(entry[2]) not in chosen]
+        heapq.heapify(self._heap)
+        now = time.perf_counter()
+        ready = []
+        for item in batch:
+            if item.cancelled:
+                continue
+            if item.attempts == 0:
+                EMBEDDING_QUEUE_WAIT_SECONDS.labels(_PRIORITY_NAMES.get(item.priority, "ingest")).observe(now - item.enqueued)
+            # Повторно отправляемые элементы уже в состоянии running
+            if item.future.running() or item.future.set_running_or_notify_cancel():
+                ready.append(item)
+        return ready
+
+    def _requeue(self, batch: List[_Item], delay: float):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            for item in batch:
+                heapq.heappush(self._heap, (item.priority, next(self._seq), item))
+            self._cond.notify()
+
+    # ---------- Отправка ----------
+
+    def _send(self, priority: int, batch: List[_Item]):
+        try:
+            if batch:
+                self._send_batch(batch)
+        finally:
+            with self._cond:
+                self._inflight[priority] -= 1
+                self._cond.notify()
+
+    def _send_batch(self, batch: List[_Item]):
+        import openai
+
+        dims = batch[0].dimensions
+        extra = {"dimensions": dims} if dims else {}
+        # Повторы делает диспетчер (общая пауза для всех), а не клиент
+        client = get_openai_client().with_options(max_retries=0)
+        start = time.perf_counter()
+        try:
+            resp = client.embeddings.create(input=[item.text for item in batch], model=self.model, **extra)
+        except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+            if isinstance(e, openai.RateLimitError):
+                EMBEDDING_RATE_LIMITED.inc()
+            retry = []
+            for item in batch:
+                if item.cancelled:
+                    continue
+                item.attempts += 1
+                if item.attempts > self.max_retries:
+                    item.future.set_exception(e)
+                else:
+                    retry.append(item)
+            delay = _retry_after(e) or min(60.0, 0.5 * 2 ** max(item.attempts for item in batch))
+            logger.warning("[embed] %s, retrying %d input(s) in %.1fs", type(e).__name__, len(retry), delay)
+            if retry:
+                self._requeue(retry, delay)
+            return
+        except Exception as e:
+            for item in batch:
+                item.future.set_exception(e)
+            return
+        end = time.perf_counter()
+
+        EMBEDDING_REQUEST_SECONDS.observe(end - start)
+        EMBEDDING_BATCH_INPUTS.observe(len(batch))
+        if resp.usage is not None:
+            EMBEDDING_BATCH_TOKENS.observe(resp.usage.total_tokens)
+            EMBEDDING_TOKENS.inc(resp.usage.total_tokens)
+        for data in resp.data:
+            batch[data.index].future.set_result(data.embedding)
+        # В трассу каждого участника добавляем span общего батча
+        own: Dict[int, list] = {}
+        for item in batch:
+            if item.span is not None:
+                own.setdefault(id(item.span), [item.span, 0])[1] += 1
+        for parent, count in own.values():
+            parent.add_child("embed_batch", start, end, inputs=len(batch), own_inputs=count)
+
+
+def _retry_after(error) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+_dispatcher: Optional[EmbeddingDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher(model: str) -> EmbeddingDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = EmbeddingDispatcher(model)
+    return _dispatcher
@@ -1,15 +1,50 @@
-import tiktoken
-import openai
+import hashlib
 import os
-from typing import List, Tuple
-from dotenv import load_dotenv
+import shutil
+import threading
+import time
+from concurrent.futures import wait
+from typing import List, Optional, Tuple
+from backend.utils.embed_scheduler import PRIORITY_INGEST, PRIORITY_QUERY, get_dispatcher
+from backend.utils.job_queue import raise_if_cancelled
+from backend.utils.metrics import CHUNKING_SECONDS, CHUNKS_PER_DOCUMENT
 
-# Загружаем переменные окружения из .env
-load_dotenv()
+EMBEDDING_MODEL = "text-embedding-3-large"
+# Сокращённая размерность (параметр `dimensions` моделей text-embedding-3); пусто — полная (3072)
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
 
-# Получаем ключ из окружения
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-assert OPENAI_API_KEY, "OPENAI_API_KEY не найден в окружении!"
+# tiktoken и OpenAI-клиент импортируются лениво: импорт backend.main не должен
+# тянуть тяжёлые зависимости и ходить в сеть за BPE-файлами.
+_encoding = None
+_encoding_lock = threading.Lock()
+
+# URL, под которым tiktoken кэширует BPE-файл cl100k_base (ключ кэша — sha1 от URL)
+_CL100K_URL = "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken"
+
+def _seed_tiktoken_cache(bpe_file: str):
+    """Кладёт поставляемый вместе с образом BPE-файл в кэш tiktoken, чтобы не качать его при старте."""
+    cache_dir = os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.join("data", "tiktoken"))
+    cache_path = os.path.join(cache_dir, hashlib.sha1(_CL100K_URL.encode()).hexdigest())
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        shutil.copyfile(bpe_file, cache_path)
+
+def get_encoding():
+    """
+    Токенизатор для EMBEDDING_MODEL. Для офлайн-старта задайте TIKTOKEN_CACHE_DIR
+    с заранее прогретым кэшем или TIKTOKEN_BPE_FILE — путь к cl100k_base.tiktoken.
+    """
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                bpe_file = os.getenv("TIKTOKEN_BPE_FILE")
+                if bpe_file:
+                    _seed_tiktoken_cache(bpe_file)
+                import tiktoken
+
+                _encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+    return _encoding
 
 # Чанкинг Markdown на куски ≤800 токенов с overlap
 
@@ -17,7 +52,8 @@ def chunk_markdown(md_text: str, max_tokens: int = 800, overlap: int = 100) -> L
     """
     Делит текст на чанки по max_tokens с overlap.
     """
-    enc = tiktoken.encoding_for_model("text-embedding-3-large")
+    start = time.perf_counter()
+    enc = get_encoding()
     tokens = enc.encode(md_text)
     chunks = []
     i = 0
@@ -28,20 +64,31 @@ def chunk_markdown(md_text: str, max_tokens: int = 800, overlap: int = 100) -> L
         if i + max_tokens >= len(tokens):
             break
         i += max_tokens - overlap
+    CHUNKING_SECONDS.observe(time.perf_counter() - start)
+    CHUNKS_PER_DOCUMENT.observe(len(chunks))
     return chunks
 
-# Получение эмбеддингов через OpenAI
+# Получение эмбеддингов через OpenAI (общий диспетчер, см. embed_scheduler)
 
-def get_embeddings(chunks: List[str]) -> List[List[float]]:
+def get_embeddings(chunks: List[str], dimensions: Optional[int] = None,
+                   priority: int = PRIORITY_INGEST) -> List[List[float]]:
     """
-    Получает эмбеддинги для каждого чанка через OpenAI API.
+    Получает эмбеддинги для каждого чанка через общий диспетчер (батчи, лимиты TPM/RPM).
+    `dimensions` по умолчанию берётся из EMBEDDING_DIMENSIONS; для вопросов
+    пользователя передавайте priority=PRIORITY_QUERY.
     """
-    client = openai.OpenAI(api_key=OPENAI_API_KEY)
-    embeddings = []
-    for chunk in chunks:
-        resp = client.embeddings.create(
-            input=chunk,
-            model="text-embedding-3-large"
-        )
-        embeddings.append(resp.data[0].embedding)
-    return embeddings 
\ No newline at end of file
+    if not chunks:
+        return []
+    dimensions = dimensions or EMBEDDING_DIMENSIONS
+    enc = get_encoding()
+    tokens = [len(enc.encode_ordinary(chunk)) for chunk in chunks]
+    futures = get_dispatcher(EMBEDDING_MODEL).submit(chunks, tokens, dimensions, priority)
+    try:
+        # Ждём короткими интервалами, чтобы отмена задачи снимала её входы из очереди диспетчера
+        while wait(futures, timeout=0.25).not_done:
+            raise_if_cancelled()
+        return [f.result() for f in futures]
+    except BaseException:
+        for f in futures:
+            f.cancel()
+        raise
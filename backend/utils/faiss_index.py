@@ -1,12 +1,30 @@
-import faiss
-import numpy as np
 import os
 import json
+import threading
+import time
+from collections import OrderedDict
 from typing import List, Tuple
+from backend.utils.metrics import FAISS_BUILD_SECONDS, FAISS_LOAD_SECONDS, FAISS_SEARCH_SECONDS, track_cache
+from backend.utils.tracing import span
+
+# faiss и numpy импортируются внутри функций — это заметно ускоряет импорт backend.main
 
 # Папка для индексов
 INDEX_DIR = os.path.join("data", "index")
 
+# Хранение векторов в индексе: flat (float32, IndexFlatL2), fp16 или int8 (IndexScalarQuantizer)
+INDEX_STORAGE = os.getenv("INDEX_STORAGE", "flat").lower()
+_SQ_TYPES = {"fp16": "QT_fp16", "int8": "QT_8bit"}
+# Для fp16/int8: хранить рядом float32-векторы (.npy) и пересортировывать кандидатов точно
+INDEX_RERANK = os.getenv("INDEX_RERANK", "0").lower() in ("1", "true", "yes")
+RERANK_OVERSAMPLE = int(os.getenv("RERANK_OVERSAMPLE", "4"))
+
+# LRU загруженных индексов: (file_id, pipeline) -> (mtime, index, passages, vectors|None)
+INDEX_CACHE_SIZE = int(os.getenv("INDEX_CACHE_SIZE", "32"))
+_index_cache: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+_index_cache_lock = threading.Lock()
+track_cache("faiss_index", lambda: len(_index_cache))
+
 # Получить путь к индексу по pipeline
 
 def get_index_path(file_id: str, pipeline: str) -> str:
@@ -15,33 +33,137 @@ def get_index_path(file_id: str, pipeline: str) -> str:
 def get_meta_path(file_id: str, pipeline: str) -> str:
     return os.path.join(INDEX_DIR, f"{file_id}_{pipeline}.json")
 
+def get_vectors_path(file_id: str, pipeline: str) -> str:
+    return os.path.join(INDEX_DIR, f"{file_id}_{pipeline}.npy")
+
+# Построение индекса и поиск (общие для сервиса и benchmarks/vector_compression.py)
+
+def build_index(arr, storage: str = INDEX_STORAGE):
+    """Строит индекс по матрице float32 (n, dim) с выбранным способом хранения."""
+    import faiss
+
+    dim = arr.shape[1]
+    if storage == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif storage in _SQ_TYPES:
+        qtype = getattr(faiss.ScalarQuantizer, _SQ_TYPES[storage])
+        index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_L2)
+        # Обучение SQ — это min/max по измерениям, дёшево даже на одном документе
+        index.train(arr)
+    else:
+        raise ValueError(f"Неизвестный INDEX_STORAGE: {storage} (ожидается flat, fp16 или int8)")
+    index.add(arr)
+    return index
+
+def search_index(index, query, top_k: int, vectors=None, oversample: int = RERANK_OVERSAMPLE):
+    """
+    Поиск top_k для одного запроса (query: float32 (1, dim)). Если переданы
+    полноточные `vectors` (в т.ч. memmap), берём top_k*oversample кандидатов
+    из индекса и пересчитываем для них точные L2-расстояния.
+    Возвращает (distances, ids) без пустых (-1) позиций.
+    """
+    import numpy as np
+
+    k = min(top_k * oversample if vectors is not None else top_k, index.ntotal)
+    if k <= 0:
+        return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+    D, I = index.search(query, k)
+    valid = I[0] >= 0
+    D, I = D[0][valid], I[0][valid]
+    if vectors is None:
+        return D, I
+    order = np.sort(I)  # чтение memmap по возрастанию смещений
+    exact = ((np.asarray(vectors[order], dtype="float32") - query[0]) ** 2).sum(axis=1)
+    best = np.argsort(exact, kind="stable")[:top_k]
+    return exact[best], order[best]
+
 # Создать и сохранить индекс
 
 def create_faiss_index(embeddings: List[List[float]], passages: List[str], file_id: str, pipeline: str):
+    import faiss
+    import numpy as np
+
+    start = time.perf_counter()
     # Ensure index directory exists
     os.makedirs(INDEX_DIR, exist_ok=True)
-    dim = len(embeddings[0])
-    index = faiss.IndexFlatL2(dim)
     arr = np.array(embeddings).astype('float32')
-    index.add(arr)
+    index = build_index(arr)
+    # Полноточные векторы для re-rank (пишем до индекса: кэш сверяется по mtime .faiss);
+    # при flat они совпадают с индексом и не нужны
+    vectors_path = get_vectors_path(file_id, pipeline)
+    if INDEX_RERANK and INDEX_STORAGE != "flat":
+        np.save(vectors_path, arr)
+    elif os.path.exists(vectors_path):
+        os.remove(vectors_path)
     faiss.write_index(index, get_index_path(file_id, pipeline))
     # Сохраняем соответствие: passage_id -> текст
     with open(get_meta_path(file_id, pipeline), "w", encoding="utf-8") as f:
         json.dump(passages, f, ensure_ascii=False)
+    FAISS_BUILD_SECONDS.observe(time.perf_counter() - start)
+
+# Загрузить индекс и метаинформацию (с кэшем; файл перечитывается, если изменился на диске)
 
-# Загрузить индекс и метаинформацию
+def _load_entry(file_id: str, pipeline: str):
+    key = (file_id, pipeline)
+    index_path = get_index_path(file_id, pipeline)
+    mtime = os.path.getmtime(index_path)
+    with _index_cache_lock:
+        cached = _index_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            _index_cache.move_to_end(key)
+            return cached
+
+    import faiss
+    import numpy as np
+
+    start = time.perf_counter()
+    with span("index_read", file_id=file_id):
+        index = faiss.read_index(index_path)
+        with open(get_meta_path(file_id, pipeline), "r", encoding="utf-8") as f:
+            passages = json.load(f)
+        vectors_path = get_vectors_path(file_id, pipeline)
+        # memmap: полноточные векторы остаются на диске, читаются только кандидаты
+        vectors = np.load(vectors_path, mmap_mode="r") if os.path.exists(vectors_path) else None
+    FAISS_LOAD_SECONDS.observe(time.perf_counter() - start)
+    entry = (mtime, index, passages, vectors)
+    if INDEX_CACHE_SIZE > 0:
+        with _index_cache_lock:
+            _index_cache[key] = entry
+            _index_cache.move_to_end(key)
+            while len(_index_cache) > INDEX_CACHE_SIZE:
+                _index_cache.popitem(last=False)
+    return entry
 
 def load_faiss_index(file_id: str, pipeline: str):
-    index = faiss.read_index(get_index_path(file_id, pipeline))
-    with open(get_meta_path(file_id, pipeline), "r", encoding="utf-8") as f:
-        passages = json.load(f)
+    _, index, passages, _ = _load_entry(file_id, pipeline)
     return index, passages
 
+def warm_index_cache(limit: int = INDEX_CACHE_SIZE) -> int:
+    """Загружает в кэш `limit` самых свежих индексов из INDEX_DIR. Возвращает число загруженных."""
+    if not os.path.isdir(INDEX_DIR) or limit <= 0:
+        return 0
+    paths = [os.path.join(INDEX_DIR, name) for name in os.listdir(INDEX_DIR) if name.endswith(".faiss")]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    loaded = 0
+    for path in paths[:limit]:
+        # <file_id>_<pipeline>.faiss; file_id — uuid без '_'
+        file_id, _, pipeline = os.path.basename(path)[:-len(".faiss")].partition("_")
+        if not pipeline or not os.path.exists(get_meta_path(file_id, pipeline)):
+            continue
+        load_faiss_index(file_id, pipeline)
+        loaded += 1
+    return loaded
+
 # Поиск top_k ближайших чанков
 
 def search_faiss_index(file_id: str, pipeline: str, query_emb: List[float], top_k: int = 5) -> Tuple[List[Tuple[int, float]], list]:
-    index, passages = load_faiss_index(file_id, pipeline)
+    import numpy as np
+
+    _, index, passages, vectors = _load_entry(file_id, pipeline)
     arr = np.array([query_emb]).astype('float32')
-    D, I = index.search(arr, top_k)
+    start = time.perf_counter()
+    with span("faiss_search", top_k=top_k, rerank=vectors is not None):
+        D, I = search_index(index, arr, top_k, vectors)
+    FAISS_SEARCH_SECONDS.observe(time.perf_counter() - start)
     # Возвращаем индексы и расстояния
-    return [(int(i), float(d)) for i, d in zip(I[0], D[0])], passages 
\ No newline at end of file
+    return [(int(i), float(d)) for i, d in zip(I, D)], passages
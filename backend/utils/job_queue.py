@@ -0,0 +1,129 @@
+"""
+Планировщик фоновых задач: ограниченная очередь с приоритетами,
+admission control и отмена.
+
+Не больше MAX_CONCURRENT_JOBS задач выполняются одновременно, ещё до
+MAX_QUEUED_JOBS ждут в очереди (одиночные файлы впереди пакетов и ZIP).
+Отмена кооперативная: у задачи есть `threading.Event`, который через
+ContextVar виден в рабочих потоках стадий (`raise_if_cancelled`). Поток
+стадии прервать нельзя, поэтому выполняющаяся задача держит слот, пока не
+дойдёт до ближайшей проверки, — иначе лимит параллельности бы не соблюдался.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_FILE = 0   # /upload-file
+PRIORITY_BATCH = 1  # /upload-files
+PRIORITY_ZIP = 2    # /upload-zip
+
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "20"))
+QUEUE_RETRY_AFTER = int(os.getenv("QUEUE_RETRY_AFTER", "30"))  # секунд, для заголовка Retry-After
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int = QUEUE_RETRY_AFTER):
+        super().__init__("Очередь задач заполнена")
+        self.retry_after = retry_after
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# ---------- Кооперативная отмена ----------
+
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar("docmark_cancel_event", default=None)
+
+
+@contextmanager
+def cancel_scope(event: threading.Event):
+    """Делает `event` флагом отмены для текущего контекста (и потоков asyncio.to_thread)."""
+    token = _cancel_event.set(event)
+    try:
+        yield event
+    finally:
+        _cancel_event.reset(token)
+
+
+def cancel_requested() -> bool:
+    event = _cancel_event.get()
+    return event is not None and event.is_set()
+
+
+def raise_if_cancelled():
+    if cancel_requested():
+        raise JobCancelled("Задача отменена")
+
+
+# ---------- Планировщик ----------
+
+class JobScheduler:
+    """Работает в event loop приложения; все методы вызываются из него же."""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_JOBS, max_queued: int = MAX_QUEUED_JOBS):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max_queued
+        self._heap: List[tuple] = []  # (priority, seq, job_id, factory)
+        self._seq = itertools.count()
+        self._running: Dict[str, asyncio.Task] = {}
+
+    def is_full(self) -> bool:
+        # Свободный слот выполнения — задача не задержится в очереди
+        return len(self._heap) >= self.max_queued and len(self._running) >= self.max_concurrent
+
+    def submit(self, job_id: str, priority: int, factory: Callable[[], Awaitable[None]]):
+        if self.is_full():
+            raise QueueFull()
+        heapq.heappush(self._heap, (priority, next(self._seq), job_id, factory))
+        self._pump()
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Позиция в очереди (1 — следующая на запуск) или None, если задача не ждёт."""
+        for pos, entry in enumerate(sorted(self._heap, key=lambda e: (e[0], e[1])), start=1):
+            if entry[2] == job_id:
+                return pos
+        return None
+
+    def queued(self) -> int:
+        return len(self._heap)
+
+    def running(self) -> int:
+        return len(self._running)
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Снимает задачу из очереди ("dequeued"); выполняющаяся ("cancelling")
+        остановится сама по флагу отмены, который выставляет вызывающий."""
+        for i, entry in enumerate(self._heap):
+            if entry[2] == job_id:
+                self._heap.pop(i)
+                heapq.heapify(self._heap)
+                return "dequeued"
+        if job_id in self._running:
+            return "cancelling"
+        return None
+
+    def _pump(self):
+        while self._heap and len(self._running) < self.max_concurrent:
+            _, _, job_id, factory = heapq.heappop(self._heap)
+            self._running[job_id] = asyncio.create_task(self._run(job_id, factory), name=f"job-{job_id}")
+
+    async def _run(self, job_id: str, factory: Callable[[], Awaitable[None]]):
+        try:
+            await factory()
+        except asyncio.CancelledError:
+            logger.info("[job_queue] Job %s cancelled", job_id)
+        except Exception:
+            logger.exception("[job_queue] Job %s crashed", job_id)
+        finally:
+            self._running.pop(job_id, None)
+            self._pump()
@@ -1,9 +1,7 @@
-import openai
-import os
+import time
 from typing import List
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-assert OPENAI_API_KEY, "OPENAI_API_KEY не найден в окружении!"
+from backend.utils.metrics import LLM_REQUEST_SECONDS, LLM_TOKENS
+from backend.utils.openai_client import get_openai_client
 
 # Формируем prompt для LLM
 
@@ -20,14 +18,25 @@ def build_prompt(passages: List[str], question: str) -> str:
 
 # Вызов LLM (GPT-4o)
 
+LLM_MODEL = "gpt-4o"
+
 def ask_llm(prompt: str) -> str:
-    client = openai.OpenAI(api_key=OPENAI_API_KEY)
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.0,
-        max_tokens=512
-    )
+    client = get_openai_client()
+    start = time.perf_counter()
+    try:
+        response = client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0,
+            max_tokens=512
+        )
+    except Exception:
+        LLM_REQUEST_SECONDS.labels(LLM_MODEL, "error").observe(time.perf_counter() - start)
+        raise
+    LLM_REQUEST_SECONDS.labels(LLM_MODEL, "ok").observe(time.perf_counter() - start)
+    if response.usage is not None:
+        LLM_TOKENS.labels(LLM_MODEL, "prompt").inc(response.usage.prompt_tokens)
+        LLM_TOKENS.labels(LLM_MODEL, "completion").inc(response.usage.completion_tokens)
     # Гарантируем возврат строки, даже если content == None (KISS)
     return response.choices[0].message.content or ""
 
@@ -0,0 +1,162 @@
+"""
+Prometheus-метрики сервиса.
+
+Все метрики объявлены здесь на уровне модуля, остальные модули только
+вызывают `observe()` / `inc()` — это O(1) под локом и не заметно на фоне
+конвертации, сетевых вызовов и FAISS. Gauge'и по задачам и кэшам
+считаются лениво, в момент scrape (`set_function`).
+"""
+import time
+from typing import Callable, Dict, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# ---------- Buckets ----------
+_SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+_NET_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+_TOKEN_BUCKETS = (100, 500, 1000, 5000, 10_000, 50_000, 100_000, 300_000)
+
+# ---------- Конвертация ----------
+CONVERSION_SECONDS = Histogram(
+    "docmark_conversion_seconds",
+    "Полное время convert_to_markdown с учётом fallback",
+    ["requested", "used"],
+    buckets=_SLOW_BUCKETS,
+)
+CONVERTER_SECONDS = Histogram(
+    "docmark_converter_seconds",
+    "Время одной попытки конвертера (Python API или CLI)",
+    ["converter", "method", "outcome"],
+    buckets=_SLOW_BUCKETS,
+)
+CONVERSION_FALLBACKS = Counter(
+    "docmark_conversion_fallbacks_total",
+    "Переходы на запасной pipeline (docling -> markitdown и обратно)",
+    ["from_pipeline", "to_pipeline"],
+)
+CONVERTER_CLI_FALLBACKS = Counter(
+    "docmark_converter_cli_fallbacks_total",
+    "Переходы с Python API конвертера на CLI",
+    ["converter"],
+)
+
+# ---------- Чанкинг и эмбеддинги ----------
+CHUNKING_SECONDS = Histogram(
+    "docmark_chunking_seconds",
+    "Время chunk_markdown на документ",
+    buckets=_FAST_BUCKETS + (5, 10),
+)
+CHUNKS_PER_DOCUMENT = Histogram(
+    "docmark_chunks_per_document",
+    "Число чанков на документ",
+    buckets=_SIZE_BUCKETS,
+)
+EMBEDDING_REQUEST_SECONDS = Histogram(
+    "docmark_embedding_request_seconds",
+    "Время одного запроса к embeddings API (батча)",
+    buckets=_NET_BUCKETS,
+)
+EMBEDDING_BATCH_INPUTS = Histogram(
+    "docmark_embedding_batch_inputs",
+    "Число входов в одном запросе к embeddings API",
+    buckets=_SIZE_BUCKETS,
+)
+EMBEDDING_BATCH_TOKENS = Histogram(
+    "docmark_embedding_batch_tokens",
+    "Токенов в одном запросе к embeddings API (по usage)",
+    buckets=_TOKEN_BUCKETS,
+)
+EMBEDDING_TOKENS = Counter(
+    "docmark_embedding_tokens_total",
+    "Всего токенов, отправленных в embeddings API",
+)
+EMBEDDING_QUEUE_DEPTH = Gauge(
+    "docmark_embedding_queue_depth",
+    "Входы, ожидающие отправки в общем диспетчере эмбеддингов",
+    ["priority"],
+)
+EMBEDDING_QUEUE_WAIT_SECONDS = Histogram(
+    "docmark_embedding_queue_wait_seconds",
+    "Ожидание входа в очереди диспетчера до отправки",
+    ["priority"],
+    buckets=_FAST_BUCKETS + (5, 10, 30, 60),
+)
+EMBEDDING_RATE_LIMITED = Counter(
+    "docmark_embedding_rate_limited_total",
+    "Ответы 429 от embeddings API",
+)
+
+# ---------- FAISS ----------
+FAISS_BUILD_SECONDS = Histogram(
+    "docmark_faiss_build_seconds",
+    "Построение и запись FAISS-индекса",
+    buckets=_FAST_BUCKETS + (5, 10, 30),
+)
+FAISS_LOAD_SECONDS = Histogram(
+    "docmark_faiss_load_seconds",
+    "Чтение FAISS-индекса и фрагментов с диска",
+    buckets=_FAST_BUCKETS + (5, 10),
+)
+FAISS_SEARCH_SECONDS = Histogram(
+    "docmark_faiss_search_seconds",
+    "Поиск top_k в загруженном индексе",
+    buckets=_FAST_BUCKETS,
+)
+
+# ---------- LLM ----------
+LLM_REQUEST_SECONDS = Histogram(
+    "docmark_llm_request_seconds",
+    "Время запроса к chat completions",
+    ["model", "outcome"],
+    buckets=_NET_BUCKETS + (120,),
+)
+LLM_TOKENS = Counter(
+    "docmark_llm_tokens_total",
+    "Токены LLM по usage",
+    ["model", "kind"],
+)
+
+# ---------- Задачи и кэши ----------
+ACTIVE_JOBS = Gauge("docmark_active_jobs", "Задачи в работе (конвертация/эмбеддинги)")
+QUEUE_DEPTH = Gauge("docmark_queue_depth", "Задачи, ожидающие запуска")
+CACHE_ENTRIES = Gauge("docmark_cache_entries", "Размер in-memory кэшей", ["cache"])
+
+_ACTIVE_STATUSES = {"converting", "embedding"}
+_QUEUED_STATUSES = {"pending", "queued"}
+
+
+def track_jobs(jobs: Dict[str, Dict]):
+    """Подключает gauge'и задач к реестру `jobs` (считаются при scrape)."""
+    def _count(statuses):
+        return lambda: sum(1 for job in list(jobs.values()) if job.get("status") in statuses)
+
+    ACTIVE_JOBS.set_function(_count(_ACTIVE_STATUSES))
+    QUEUE_DEPTH.set_function(_count(_QUEUED_STATUSES))
+    track_cache("jobs", lambda: len(jobs))
+
+
+def track_queue(counts_fn: Callable[[], Dict[str, int]], ttl: float = 1.0):
+    """Gauge'и задач по внешней очереди (INGEST_MODE=queue): статусы считает `counts_fn`.
+
+    Результат кэшируется на `ttl` секунд, чтобы оба gauge'а одного scrape обходились одним запросом.
+    """
+    cache = {"at": float("-inf"), "counts": {}}
+
+    def _counts() -> Dict[str, int]:
+        now = time.monotonic()
+        if now - cache["at"] > ttl:
+            cache["counts"], cache["at"] = counts_fn(), now
+        return cache["counts"]
+
+    ACTIVE_JOBS.set_function(lambda: _counts().get("running", 0))
+    QUEUE_DEPTH.set_function(lambda: _counts().get("queued", 0))
+
+
+def track_cache(name: str, size_fn: Callable[[], float]):
+    CACHE_ENTRIES.labels(name).set_function(size_fn)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,33 @@
+import os
+import threading
+
+# Общий клиент OpenAI: создаётся при первом обращении, а не при импорте,
+# и переиспользует пул соединений между запросами.
+_client = None
+_lock = threading.Lock()
+_env_loaded = False
+
+
+def load_env():
+    """Подгружает .env (один раз). Уже заданные переменные окружения не перезаписываются."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _env_loaded = True
+
+
+def get_openai_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                load_env()
+                api_key = os.getenv("OPENAI_API_KEY")
+                if not api_key:
+                    raise RuntimeError("OPENAI_API_KEY не найден в окружении!")
+                import openai
+
+                _client = openai.OpenAI(api_key=api_key)
+    return _client
@@ -0,0 +1,129 @@
+"""
+Лёгкие трассы выполнения: дерево span'ов с таймингами на задачу и на `/query`.
+
+Текущий span хранится в `ContextVar`, поэтому `asyncio.to_thread` (копирует
+контекст) корректно вкладывает span'ы из рабочих потоков. Вне трассы
+`span()` ничего не делает и почти ничего не стоит.
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("docmark_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "error", "children")
+
+    def __init__(self, name: str, attrs: Optional[Dict] = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+        self.children: List["Span"] = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def add_child(self, name: str, start: float, end: float, **attrs) -> "Span":
+        """Добавляет уже завершённый дочерний span (например, из другого потока)."""
+        child = Span(name, attrs)
+        child.start, child.end = start, end
+        self.children.append(child)
+        return child
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict:
+        origin = self.start if origin is None else origin
+        out = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "running": self.end is None,
+        }
+        if self.attrs:
+            out["attrs"] = self.attrs
+        if self.error:
+            out["error"] = self.error
+        if self.children:
+            out["children"] = [c.to_dict(origin) for c in list(self.children)]
+        return out
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def _enter(sp: Span):
+    token = _current_span.set(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.error = repr(e)
+        raise
+    finally:
+        sp.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    """Открывает корневой span новой трассы."""
+    with _enter(Span(name, attrs)) as root:
+        yield root
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Дочерний span текущей трассы; без активной трассы — no-op."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attrs)
+    parent.children.append(child)
+    with _enter(child) as sp:
+        yield sp
+
+
+class JobProfiler:
+    """
+    Собирает cProfile по стадиям задачи. cProfile профилирует только
+    текущий поток, поэтому каждая стадия запускается через `call()` в
+    своём потоке, а статистика суммируется.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Optional[pstats.Stats] = None
+
+    def call(self, fn, *args, **kwargs):
+        prof = cProfile.Profile()
+        try:
+            return prof.runcall(fn, *args, **kwargs)
+        finally:
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(prof)
+                else:
+                    self._stats.add(prof)
+
+    def dump(self, path: str, top: int = 40) -> Optional[Dict]:
+        """Сохраняет .prof и возвращает краткую сводку (топ по cumulative)."""
+        with self._lock:
+            if self._stats is None:
+                return None
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._stats.dump_stats(path)
+            buf = io.StringIO()
+            self._stats.stream = buf
+            self._stats.sort_stats("cumulative").print_stats(top)
+        return {"path": path, "top_cumulative": buf.getvalue()}
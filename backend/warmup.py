@@ -0,0 +1,118 @@
+"""
+Прогрев тяжёлых зависимостей и состояние готовности для `/readyz`.
+
+Импорт `backend.main` ничего тяжёлого не загружает; всё это делается
+здесь — в фоне при старте приложения или заранее, при сборке образа:
+
+    python -m backend.warmup            # прогреть всё и вывести статус
+    python -m backend.warmup tokenizer  # только скачать/проверить BPE-файлы tiktoken
+"""
+import logging
+import os
+import sys
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+INDEX_WARM_COUNT = int(os.getenv("INDEX_WARM_COUNT", "8"))
+
+# check -> "pending" | "ok" | "skipped" | "error: ..."
+readiness: Dict[str, str] = {
+    "tokenizer": "pending",
+    "converters": "pending",
+    "openai_client": "pending",
+    "indexes": "pending",
+}
+
+
+def _check(name: str, fn):
+    start = time.perf_counter()
+    try:
+        result = fn()
+        readiness[name] = "ok" if result is None else f"ok: {result}"
+        logger.info("[warmup] %s ready in %.2f sec", name, time.perf_counter() - start)
+    except Exception as e:
+        readiness[name] = f"error: {e}"
+        logger.warning("[warmup] %s failed: %s", name, e, exc_info=True)
+
+
+def _warm_tokenizer():
+    from backend.utils.embedding import get_encoding
+
+    get_encoding().encode("warm-up")
+
+
+def _warm_converters():
+    # Достаточно одного рабочего pipeline: convert_to_markdown умеет fallback.
+    # DocLing прогревается по-настоящему: пул конвертеров с загруженными моделями
+    # PDF-pipeline, который потом использует convert_with_docling.
+    available = []
+    try:
+        from backend.utils.conversion import warm_docling_converters
+
+        available.append(f"docling x{warm_docling_converters()}")
+    except Exception as e:
+        logger.warning("[warmup] DocLing недоступен: %s", e)
+    try:
+        from markitdown import MarkItDown  # type: ignore  # noqa: F401
+        available.append("markitdown")
+    except Exception as e:
+        logger.warning("[warmup] MarkItDown недоступен: %s", e)
+    if not available:
+        raise RuntimeError("ни DocLing, ни MarkItDown не импортируются")
+    return ",".join(available)
+
+
+def _warm_openai_client():
+    from backend.utils.openai_client import get_openai_client
+
+    get_openai_client()
+
+
+def _warm_indexes():
+    from backend.utils.faiss_index import warm_index_cache
+
+    return f"{warm_index_cache(INDEX_WARM_COUNT)} loaded"
+
+
+CHECKS = {
+    "tokenizer": _warm_tokenizer,
+    "converters": _warm_converters,
+    "openai_client": _warm_openai_client,
+    "indexes": _warm_indexes,
+}
+
+
+def warm_up(*names: str):
+    """Выполняет указанные (по умолчанию все) проверки прогрева."""
+    for name in names or CHECKS:
+        _check(name, CHECKS[name])
+
+
+def skip(*names: str):
+    """Отмечает проверки как пропущенные (прогрев выключен): /readyz их не ждёт."""
+    for name in names or CHECKS:
+        readiness[name] = "skipped"
+
+
+def is_ready() -> bool:
+    return all(state.startswith("ok") or state == "skipped" for state in readiness.values())
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"),
+                        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    names = list(argv if argv is not None else sys.argv[1:])
+    unknown = [n for n in names if n not in CHECKS]
+    if unknown:
+        print(f"Неизвестные проверки: {', '.join(unknown)}; доступны: {', '.join(CHECKS)}")
+        return 2
+    warm_up(*names)
+    for name in names or CHECKS:
+        print(f"{name:<14} {readiness[name]}")
+    return 0 if all(readiness[n].startswith("ok") for n in names or CHECKS) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Отдельный процесс загрузки документов: конвертация, эмбеддинги и запись
+индексов вне процесса API.
+
+API при INGEST_MODE=queue только сохраняет оригиналы и ставит задачи в
+durable-очередь (`backend/utils/durable_queue.py`); воркеры на этой же или
+других машинах с общим каталогом data/ забирают их по одной с арендой,
+продлевают её heartbeat'ом и пишут туда же прогресс и итог. Если воркер
+упал, задачу после истечения аренды подхватит другой.
+
+    INGEST_MODE=queue uvicorn backend.main:app --port 8000
+    python -m backend.worker --concurrency 2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import uuid
+from typing import Dict, Optional
+
+from backend import main as api
+from backend import warmup
+from backend.utils import conversion, durable_queue
+
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "1"))
+WORKER_HEARTBEAT_SECONDS = float(os.getenv("WORKER_HEARTBEAT_SECONDS", "2"))
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))  # 0 — не поднимать /metrics
+
+_FINAL_STATUSES = ("ready", "error", "cancelled")
+
+
+class Worker:
+    def __init__(self, worker_id: str, concurrency: int = WORKER_CONCURRENCY,
+                 poll_seconds: float = WORKER_POLL_SECONDS, heartbeat_seconds: float = WORKER_HEARTBEAT_SECONDS,
+                 lease_seconds: float = durable_queue.JOB_LEASE_SECONDS):
+        self.worker_id = worker_id
+        self.concurrency = max(1, concurrency)
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.lease_seconds = lease_seconds
+        self._stop: Optional[asyncio.Event] = None
+
+    def stop(self):
+        if self._stop is not None and not self._stop.is_set():
+            logger.info("[worker %s] Stopping: finishing running jobs, no new claims", self.worker_id)
+            self._stop.set()
+
+    async def run(self):
+        self._stop = asyncio.Event()
+        logger.info("[worker %s] Started (concurrency=%d, queue=%s)",
+                    self.worker_id, self.concurrency, durable_queue.QUEUE_DB_PATH)
+        await asyncio.gather(*(self._slot() for _ in range(self.concurrency)))
+
+    async def _slot(self):
+        while not self._stop.is_set():
+            try:
+                job = await asyncio.to_thread(durable_queue.claim, self.worker_id, self.lease_seconds)
+            except sqlite3.Error:
+                logger.exception("[worker %s] Failed to claim a job", self.worker_id)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stop.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._execute(job)
+            except Exception:
+                # Сбой одной задачи не должен останавливать остальные слоты воркера;
+                # если итог не записан, задачу после истечения аренды возьмёт другой воркер
+                logger.exception("[worker %s] Job %s failed outside the pipeline", self.worker_id, job["id"])
+
+    async def _execute(self, job: Dict):
+        job_id, payload = job["id"], job["payload"]
+        files = [tuple(f) for f in payload["files"]]
+        logger.info("[worker %s] Claimed job %s (attempt %d, %d file(s))",
+                    self.worker_id, job_id, job["attempt"], len(files))
+        local = api.jobs[job_id] = {
+            "status": "queued", "progress": 0.0, "detail": None, "count": len(files), "done": 0, "file_ids": [],
+            "pipeline": payload["pipeline"], "project": payload.get("project"),
+            "profile_requested": payload.get("profile", False), "cancel_event": threading.Event(),
+        }
+        done = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job_id, local, done),
+                                name=f"heartbeat-{job_id[:8]}", daemon=True)
+        beat.start()
+        try:
+            await api.process_saved_files_job(job_id, files, payload["pipeline"])
+        finally:
+            done.set()
+            await asyncio.to_thread(beat.join)
+            api.jobs.pop(job_id, None)
+            try:
+                await asyncio.to_thread(self._complete, job_id, local)
+            except sqlite3.Error:
+                logger.exception("[worker %s] Failed to record result of job %s", self.worker_id, job_id)
+
+    def _heartbeat(self, job_id: str, local: Dict, done: threading.Event):
+        """Продлевает аренду, пишет прогресс и забирает флаг отмены из очереди."""
+        while not done.wait(self.heartbeat_seconds):
+            try:
+                cancel = durable_queue.heartbeat(
+                    job_id, self.worker_id, stage=local["status"], progress=local["progress"],
+                    detail=local.get("detail"), file_ids=list(local["file_ids"]), lease_seconds=self.lease_seconds,
+                )
+            except sqlite3.Error:
+                logger.warning("[worker %s] Heartbeat for job %s failed", self.worker_id, job_id, exc_info=True)
+                continue
+            if cancel is None:
+                # Аренда истекла и задача ушла другому воркеру — дальше работать незачем
+                logger.warning("[worker %s] Lost lease on job %s, abandoning it", self.worker_id, job_id)
+                local["cancel_event"].set()
+                return
+            if cancel:
+                local["cancel_event"].set()
+
+    def _complete(self, job_id: str, local: Dict):
+        status = local["status"]
+        if status not in _FINAL_STATUSES:
+            # Задачу прервала остановка воркера: возвращаем её в очередь
+            durable_queue.release(job_id, self.worker_id)
+            logger.info("[worker %s] Released unfinished job %s", self.worker_id, job_id)
+            return
+        if not durable_queue.finish(job_id, self.worker_id, status=status, progress=local["progress"],
+                                    detail=local.get("detail"), file_ids=list(local["file_ids"])):
+            logger.warning("[worker %s] Result of job %s discarded: lease lost", self.worker_id, job_id)
+            return
+        try:
+            _save_trace(job_id, local)
+        except OSError:
+            logger.warning("[worker %s] Failed to save trace of job %s", self.worker_id, job_id, exc_info=True)
+        logger.info("[worker %s] Job %s finished: %s", self.worker_id, job_id, status)
+
+
+def _save_trace(job_id: str, local: Dict):
+    """Трасса для GET /jobs/{job_id}/trace на стороне API (общий каталог data/)."""
+    root = local.get("trace")
+    if root is None:
+        return
+    os.makedirs(api.TRACE_DIR, exist_ok=True)
+    with open(api._trace_path(job_id), "w", encoding="utf-8") as f:
+        json.dump({"trace": root.to_dict(), "profile": local.get("profile")}, f, ensure_ascii=False)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Воркер загрузки документов из durable-очереди")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="Задач одновременно")
+    parser.add_argument("--worker-id", default=None, help="Имя воркера в очереди (по умолчанию host:pid:uuid)")
+    parser.add_argument("--metrics-port", type=int, default=WORKER_METRICS_PORT,
+                        help="Порт Prometheus-метрик воркера (0 — выключено)")
+    parser.add_argument("--no-warmup", action="store_true", help="Не прогревать токенизатор и конвертеры")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"),
+                        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    # Конвертеров DocLing столько, сколько задач воркер выполняет одновременно
+    conversion.configure_docling_pool(int(os.getenv("DOCLING_CONVERTERS", str(args.concurrency))))
+    worker_id = args.worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    if args.metrics_port:
+        from prometheus_client import start_http_server
+
+        start_http_server(args.metrics_port)
+    if not args.no_warmup:
+        warmup.warm_up("tokenizer", "converters", "openai_client")
+
+    worker = Worker(worker_id, concurrency=args.concurrency)
+
+    async def _run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run()
+
+    asyncio.run(_run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Бенчмарк времени импорта `backend.main` (холодный старт контейнера).
+
+Каждый замер — отдельный процесс `python -X importtime -c "import backend.main"`
+без OPENAI_API_KEY. Проверяет, что тяжёлые зависимости не загружаются при
+импорте, и что медиана времени не превышает порог; иначе код возврата 1.
+
+    python -m benchmarks.import_time --runs 5 --max-seconds 1.5
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+from benchmarks.ingest_bench import REPO_ROOT
+
+# Модули, которые должны загружаться лениво
+HEAVY_MODULES = ("faiss", "numpy", "tiktoken", "openai", "dotenv", "docling", "markitdown", "torch")
+
+_PROBE = (
+    "import sys, time, json\n"
+    "t = time.perf_counter()\n"
+    "import backend.main\n"
+    "elapsed = time.perf_counter() - t\n"
+    "heavy = sorted(m for m in {heavy!r} if m in sys.modules)\n"
+    "print(json.dumps({{'seconds': elapsed, 'heavy': heavy}}))\n"
+)
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(\s*)(\S+)")
+
+
+def _run_once(python: str) -> Dict:
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["WARMUP_ON_STARTUP"] = "0"
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", _PROBE.format(heavy=HEAVY_MODULES)],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import backend.main failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    # Топ модулей верхнего уровня по cumulative-времени
+    top = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m and not m.group(3):
+            top.append((int(m.group(2)), m.group(4)))
+    top.sort(reverse=True)
+    result["top_cumulative_ms"] = [[name, round(us / 1000, 1)] for us, name in top[:10]]
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Время импорта backend.main и проверка ленивых импортов")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=1.5, help="Порог для медианы времени импорта")
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--out", default=None, help="Куда записать JSON-отчёт")
+    args = parser.parse_args(argv)
+
+    runs = [_run_once(args.python) for _ in range(args.runs)]
+    times = [r["seconds"] for r in runs]
+    heavy = sorted({m for r in runs for m in r["heavy"]})
+    report = {
+        "runs": args.runs,
+        "median_s": round(statistics.median(times), 4),
+        "min_s": round(min(times), 4),
+        "max_s": round(max(times), 4),
+        "heavy_modules_loaded": heavy,
+        "top_cumulative_ms": runs[-1]["top_cumulative_ms"],
+    }
+    print(f"import backend.main: median {report['median_s']:.3f}s "
+          f"(min {report['min_s']:.3f}s, max {report['max_s']:.3f}s, {args.runs} runs)")
+    print("top imports (cumulative, ms):")
+    for name, ms in report["top_cumulative_ms"]:
+        print(f"  {name:<40}{ms:>10.1f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failed = False
+    if heavy:
+        print(f"FAIL: при импорте загружены тяжёлые модули: {', '.join(heavy)}")
+        failed = True
+    if report["median_s"] > args.max_seconds:
+        print(f"FAIL: медиана {report['median_s']:.3f}s > порога {args.max_seconds:.3f}s")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
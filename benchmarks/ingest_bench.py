@@ -0,0 +1,432 @@
+"""
+Офлайн-бенчмарк полного пути загрузки: `process_file_job` / `process_zip_job`.
+
+Поднимает локальную заглушку OpenAI (`benchmarks.stub_openai`), прогоняет
+PDF из `data/original` (с масштабированием копиями) и синтетический
+Markdown-корпус во временном рабочем каталоге и печатает/сохраняет отчёт:
+время по стадиям, docs/min, chunks/s, пиковый RSS. Каждый сценарий идёт в
+отдельном подпроцессе, чтобы пиковый RSS и прогретые кэши не переходили
+из одного сценария в другой.
+
+Если хоть одна задача завершилась ошибкой, код возврата 1, а сценарий
+помечается `failed` и в сравнении с baseline не участвует.
+
+Сеть не нужна, но токенизатор — нужен: без него бенчмарк сразу выходит с
+кодом 2. Задайте TIKTOKEN_CACHE_DIR (прогретый кэш) или TIKTOKEN_BPE_FILE.
+
+Пример:
+    python -m benchmarks.ingest_bench --scale 3 --synthetic-docs 50 --out bench.json
+    python -m benchmarks.ingest_bench --baseline bench.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import functools
+import glob
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from benchmarks.stub_openai import start_stub_server
+
+logger = logging.getLogger("benchmarks.ingest_bench")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("convert", "chunk", "embed", "index")
+
+# Метрики, где «больше — лучше»; остальные (секунды, МБ) — «меньше — лучше»
+HIGHER_IS_BETTER = {"docs_per_min", "chunks_per_s"}
+
+_WORDS = (
+    "школа класс ученик учитель площадь этаж здание спортзал столовая библиотека "
+    "проект смета корпус кабинет вместимость парковка участок освещение отопление "
+    "school building floor area capacity parking heating lighting section table"
+).split()
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss — пик за всё время процесса (КБ в Linux, байты в macOS), поэтому сценарий = подпроцесс
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def synthetic_markdown(doc_idx: int, approx_tokens: int, seed: int = 0) -> str:
+    """Детерминированный Markdown-документ примерно из `approx_tokens` токенов."""
+    rnd = random.Random(seed * 100003 + doc_idx)
+    parts = [f"# Синтетический документ {doc_idx}\n"]
+    words = 0
+    section = 0
+    target_words = max(1, int(approx_tokens / 1.5))  # кириллица дороже по токенам
+    while words < target_words:
+        section += 1
+        parts.append(f"\n## Раздел {section}\n")
+        for _ in range(rnd.randint(3, 8)):
+            n = rnd.randint(12, 40)
+            parts.append(" ".join(rnd.choice(_WORDS) for _ in range(n)) + ".\n")
+            words += n
+        if section % 3 == 0:
+            parts.append("\n| Параметр | Значение |\n|---|---|\n")
+            for _ in range(5):
+                parts.append(f"| {rnd.choice(_WORDS)} | {rnd.randint(1, 5000)} |\n")
+    return "".join(parts)
+
+
+class StageTimer:
+    """Оборачивает функции стадий в `backend.main` и копит их длительности."""
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = {s: [] for s in STAGES}
+        self.chunks = 0
+        self._originals = {}
+
+    def _wrap(self, stage: str, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                self.durations[stage].append(time.perf_counter() - start)
+            if stage == "chunk":
+                self.chunks += len(result)
+            return result
+        return wrapper
+
+    def install(self, module):
+        mapping = {
+            "convert_to_markdown": "convert",
+            "chunk_markdown": "chunk",
+            "get_embeddings": "embed",
+            "create_faiss_index": "index",
+        }
+        for attr, stage in mapping.items():
+            original = getattr(module, attr)
+            self._originals[attr] = original
+            setattr(module, attr, self._wrap(stage, original))
+
+    def uninstall(self, module):
+        for attr, original in self._originals.items():
+            setattr(module, attr, original)
+        self._originals.clear()
+
+    def reset(self):
+        self.durations = {s: [] for s in STAGES}
+        self.chunks = 0
+
+    def summary(self) -> Dict[str, dict]:
+        out = {}
+        for stage, values in self.durations.items():
+            out[stage] = {
+                "calls": len(values),
+                "total_s": round(sum(values), 4),
+                "mean_s": round(sum(values) / len(values), 4) if values else 0.0,
+                "p50_s": round(_percentile(values, 50), 4),
+                "p95_s": round(_percentile(values, 95), 4),
+            }
+        return out
+
+
+def _load_sources(pdf_dir: str, scale: int) -> List[tuple]:
+    pdfs = []
+    for path in sorted(glob.glob(os.path.join(pdf_dir, "*.pdf"))):
+        with open(path, "rb") as f:
+            pdfs.append((os.path.basename(path), f.read()))
+    return [(f"{i}_{name}", data) for i in range(scale) for name, data in pdfs]
+
+
+async def _run_file_jobs(main, sources: List[tuple], pipeline: str, concurrency: int) -> List[dict]:
+    """Повторяет путь `/upload-file`: сохранить оригинал, создать задачу, выполнить job."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(name: str, data: bytes, ext: str):
+        async with sem:
+            file_id, orig_path = main.save_original_file(data, ext)
+            job_id = str(uuid.uuid4())
+            main.jobs[job_id] = {"status": "pending", "progress": 0.0, "detail": None, "file_id": file_id,
+                                 "file_ids": [file_id], "pipeline": pipeline, "project": "bench"}
+            await main.process_file_job(job_id, orig_path, file_id, pipeline)
+            return main.jobs[job_id]
+
+    tasks = [one(name, data, name.rsplit(".", 1)[-1].lower()) for name, data in sources]
+    return await asyncio.gather(*tasks)
+
+
+async def _run_zip_job(main, pdfs: List[tuple], pipeline: str) -> List[dict]:
+    """Повторяет путь `/upload-zip` для уже распакованного списка PDF."""
+    job_id = str(uuid.uuid4())
+    main.jobs[job_id] = {"status": "pending", "progress": 0.0, "detail": None, "zip": True, "count": len(pdfs),
+                         "done": 0, "file_ids": [], "pipeline": pipeline, "project": "bench"}
+    await main.process_zip_job(job_id, pdfs, pipeline)
+    return [main.jobs[job_id]]
+
+
+def _run_scenario(main, timer: StageTimer, name: str, coro, docs: int) -> dict:
+    timer.reset()
+    logger.info("[bench] Scenario '%s': %d doc(s)", name, docs)
+    start = time.perf_counter()
+    results = asyncio.run(coro)
+    wall = time.perf_counter() - start
+    failed = [r for r in results if r.get("status") != "ready"]
+    for r in failed:
+        logger.warning("[bench] %s: job failed: %s", name, r.get("detail"))
+    # В пропускную способность идут только успешно обработанные документы (у ZIP-задачи — done)
+    docs_ok = sum(r.get("done", 1) for r in results if r.get("status") == "ready")
+    return {
+        "docs": docs,
+        "docs_ok": docs_ok,
+        "jobs": len(results),
+        "failed_jobs": len(failed),
+        "failed": bool(failed),
+        "chunks": timer.chunks,
+        "wall_s": round(wall, 4),
+        "docs_per_min": round(docs_ok / wall * 60, 3) if wall else 0.0,
+        "chunks_per_s": round(timer.chunks / wall, 3) if wall else 0.0,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "stages": timer.summary(),
+    }
+
+
+def compare_with_baseline(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Возвращает список регрессий относительно baseline (пустой — всё в норме).
+
+    Сценарии с упавшими задачами (в текущем прогоне или в baseline) не сравниваются.
+    """
+    regressions = []
+    for scen, cur in current.get("scenarios", {}).items():
+        base = baseline.get("scenarios", {}).get(scen)
+        if not base or _scenario_failed(cur) or _scenario_failed(base):
+            continue
+        checks = {k: (cur.get(k), base.get(k)) for k in ("wall_s", "docs_per_min", "chunks_per_s", "peak_rss_mb")}
+        for stage in STAGES:
+            checks[f"{stage}.total_s"] = (
+                cur.get("stages", {}).get(stage, {}).get("total_s"),
+                base.get("stages", {}).get(stage, {}).get("total_s"),
+            )
+        for key, (c, b) in checks.items():
+            if c is None or not b:
+                continue
+            if key in HIGHER_IS_BETTER:
+                worse = c < b * (1 - tolerance)
+            else:
+                worse = c > b * (1 + tolerance)
+            if worse:
+                regressions.append(f"{scen}.{key}: {c} vs baseline {b}")
+    return regressions
+
+
+def _scenario_failed(scenario: dict) -> bool:
+    return bool(scenario.get("failed") or scenario.get("failed_jobs"))
+
+
+def _print_report(report: dict):
+    print(f"\n{'scenario':<12}{'docs':>6}{'chunks':>8}{'wall,s':>10}{'docs/min':>10}{'chunks/s':>10}{'RSS,MB':>9}")
+    for name, s in report["scenarios"].items():
+        if "docs" not in s:
+            print(f"{name:<12} FAILED: {s.get('error')}")
+            continue
+        print(f"{name:<12}{s['docs']:>6}{s['chunks']:>8}{s['wall_s']:>10.2f}"
+              f"{s['docs_per_min']:>10.1f}{s['chunks_per_s']:>10.1f}{s['peak_rss_mb']:>9.1f}"
+              + (f"  FAILED: {s['failed_jobs']}/{s['jobs']} job(s)" if _scenario_failed(s) else ""))
+        for stage, st in s["stages"].items():
+            if st["calls"]:
+                print(f"    {stage:<9} calls={st['calls']:<5} total={st['total_s']:.3f}s "
+                      f"p50={st['p50_s']:.3f}s p95={st['p95_s']:.3f}s")
+
+
+def _build_scenario(main_mod, args, name: str):
+    """Корутина сценария и число документов в нём (None — сценарию нечего прогонять)."""
+    if name in ("file", "zip"):
+        sources = _load_sources(args.pdf_dir, args.scale)
+        if not sources:
+            return None
+        if name == "file":
+            return _run_file_jobs(main_mod, sources, args.pipeline, args.concurrency), len(sources)
+        return _run_zip_job(main_mod, sources, args.pipeline), len(sources)
+    if name == "synthetic" and args.synthetic_docs:
+        docs = [(f"synthetic_{i}.md", synthetic_markdown(i, args.synthetic_tokens).encode("utf-8"))
+                for i in range(args.synthetic_docs)]
+        return _run_file_jobs(main_mod, docs, "markdown", args.concurrency), len(docs)
+    return None
+
+
+def _run_scenario_here(args) -> Optional[dict]:
+    """Тело подпроцесса: один сценарий в своём рабочем каталоге."""
+    os.makedirs(args.workdir, exist_ok=True)
+    # Задачи пишут в относительный data/ — изолируем его в рабочем каталоге сценария
+    os.chdir(args.workdir)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import backend.main as main_mod
+
+    built = _build_scenario(main_mod, args, args.run_scenario)
+    if built is None:
+        return None
+    coro, docs = built
+    timer = StageTimer()
+    timer.install(main_mod)
+    try:
+        return _run_scenario(main_mod, timer, args.run_scenario, coro, docs)
+    finally:
+        timer.uninstall(main_mod)
+
+
+def _spawn_scenario(argv: List[str], name: str, workdir: str, stub_url: str) -> Optional[dict]:
+    result_path = os.path.join(workdir, f"{name}.result.json")
+    env = dict(os.environ, OPENAI_BASE_URL=stub_url)
+    env.setdefault("OPENAI_API_KEY", "bench-key")
+    # Подпроцесс работает из другого каталога — относительные пути токенизатора делаем абсолютными
+    for var in ("TIKTOKEN_CACHE_DIR", "TIKTOKEN_BPE_FILE"):
+        if env.get(var):
+            env[var] = os.path.abspath(env[var])
+    cmd = [sys.executable, "-m", "benchmarks.ingest_bench", *argv,
+           "--run-scenario", name, "--workdir", os.path.join(workdir, name), "--result-file", result_path]
+    proc = subprocess.run(cmd, cwd=REPO_ROOT, env=env)
+    if proc.returncode != 0:
+        logger.error("[bench] Scenario '%s' subprocess exited with %d", name, proc.returncode)
+        return {"failed": True, "error": f"exit code {proc.returncode}"}
+    if not os.path.exists(result_path):
+        return None
+    with open(result_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _check_tokenizer() -> Optional[str]:
+    """Чанкинг требует BPE-файл tiktoken; без сети его нужно подготовить заранее."""
+    from backend.utils.embedding import get_encoding
+
+    try:
+        get_encoding().encode("bench")
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def _strip_workdir(argv: List[str]) -> List[str]:
+    """Аргументы для подпроцесса: рабочий каталог и файлы отчёта задаёт родитель."""
+    out, skip = [], False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        if arg in ("--workdir", "--out", "--baseline"):
+            skip = True
+            continue
+        if arg.split("=", 1)[0] in ("--workdir", "--out", "--baseline") or arg == "--keep-workdir":
+            continue
+        out.append(arg)
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк пути загрузки документов")
+    parser.add_argument("--pdf-dir", default=os.path.join(REPO_ROOT, "data", "original"))
+    parser.add_argument("--scale", type=int, default=1, help="Сколько копий каждого PDF прогонять")
+    parser.add_argument("--synthetic-docs", type=int, default=20, help="Число синтетических Markdown-документов")
+    parser.add_argument("--synthetic-tokens", type=int, default=4000, help="Примерный размер синтетического документа")
+    parser.add_argument("--pipeline", choices=["docling", "markitdown"], default="docling")
+    parser.add_argument("--scenarios", default="file,zip,synthetic",
+                        help="Через запятую: file (PDF через process_file_job), zip, synthetic")
+    parser.add_argument("--concurrency", type=int, default=1, help="Параллельных process_file_job")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Задержка заглушки OpenAI на запрос")
+    parser.add_argument("--per-item-ms", type=float, default=0.0, help="Доп. задержка заглушки на вход эмбеддингов")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--workdir", default=None, help="Рабочий каталог (по умолчанию временный)")
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--out", default=None, help="Куда записать JSON-отчёт")
+    parser.add_argument("--baseline", default=None, help="JSON-отчёт для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимое ухудшение (доля)")
+    # Внутренние: запуск одного сценария в подпроцессе
+    parser.add_argument("--run-scenario", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"),
+                        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    logger.setLevel(logging.INFO)
+
+    if args.run_scenario:
+        result = _run_scenario_here(args)
+        if result is not None:
+            with open(args.result_file, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+        return 0
+
+    error = _check_tokenizer()
+    if error is not None:
+        print("Токенизатор tiktoken недоступен, задачи упали бы на чанкинге:\n  " + error)
+        print("Задайте TIKTOKEN_CACHE_DIR с прогретым кэшем (python -m backend.warmup tokenizer при доступе к сети)\n"
+              "или TIKTOKEN_BPE_FILE — путь к cl100k_base.tiktoken.")
+        return 2
+
+    stub = start_stub_server(latency_ms=args.latency_ms, per_item_ms=args.per_item_ms, jitter_ms=args.jitter_ms)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="ingest-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    # Подпроцесс стартует из корня репозитория — относительный --pdf-dir считаем от текущего каталога
+    child_argv = _strip_workdir(argv) + ["--pdf-dir", os.path.abspath(args.pdf_dir)]
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items()
+                     if k not in ("out", "baseline", "run_scenario", "result_file")},
+        },
+        "scenarios": {},
+    }
+    try:
+        for name in scenarios:
+            result = _spawn_scenario(child_argv, name, workdir, stub.base_url)
+            if result is not None:
+                report["scenarios"][name] = result
+    finally:
+        stub.shutdown()
+        stub.server_close()
+        if not args.keep_workdir and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report["meta"]["stub_requests"] = stub.request_counts
+    failed = [name for name, s in report["scenarios"].items() if _scenario_failed(s)]
+    _print_report(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nОтчёт сохранён: {args.out}")
+    code = 0
+    if failed:
+        print(f"\nСценарии с ошибками (не годятся как baseline и не сравниваются): {', '.join(failed)}")
+        code = 1
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print("\nРегрессии относительно baseline:")
+            for r in regressions:
+                print("  - " + r)
+            return 1
+        print("\nРегрессий относительно baseline нет.")
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""
+Нагрузочный тест backend: смесь `/query`, `/job-status`, загрузок и
+`/download-bundle` с заданным RPS.
+
+По умолчанию поднимает приложение локально (`uvicorn backend.main:app`
+отдельным процессом во временном рабочем каталоге, чтобы сервер не делил
+GIL и планировщик с генератором нагрузки) и заглушку OpenAI из
+`benchmarks.stub_openai` (тоже отдельным процессом),
+загружает несколько синтетических Markdown-документов и затем подаёт
+запросы по открытой модели (open-loop): запрос уходит по расписанию,
+не дожидаясь предыдущих. Задержка считается от запланированного момента
+отправки, поэтому блокировка event loop видна в перцентилях.
+
+Пример:
+    python -m benchmarks.load_test --rps 20 --duration 30 --mix query=6,job-status=3,upload=0.5,download-bundle=0.5
+    python -m benchmarks.load_test --url http://localhost:8000 --rps 5 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.ingest_bench import REPO_ROOT, _percentile, synthetic_markdown
+
+logger = logging.getLogger("benchmarks.load_test")
+
+ENDPOINTS = ("query", "job-status", "upload", "download-bundle")
+DEFAULT_MIX = "query=6,job-status=3,upload=0.5,download-bundle=0.5"
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Неизвестный endpoint в --mix: {name} (ожидается один из {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("Пустая смесь запросов")
+    return mix
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until(check, proc: subprocess.Popen, what: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while True:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{what} завершился с кодом {proc.returncode}")
+        if check():
+            return
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{what} не запустился за {timeout:.0f} с")
+        time.sleep(0.1)
+
+
+def _stop_process(proc: Optional[subprocess.Popen]):
+    if proc is None or proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+class LocalStub:
+    """Заглушка OpenAI (`python -m benchmarks.stub_openai`) отдельным процессом."""
+
+    def __init__(self, port: int, latency_ms: float, per_item_ms: float, jitter_ms: float):
+        self.port = port
+        self.cmd = [sys.executable, "-m", "benchmarks.stub_openai", "--host", "127.0.0.1", "--port", str(port),
+                    "--latency-ms", str(latency_ms), "--per-item-ms", str(per_item_ms), "--jitter-ms", str(jitter_ms)]
+        self.proc: Optional[subprocess.Popen] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def _listening(self) -> bool:
+        try:
+            with socket.create_connection(("127.0.0.1", self.port), timeout=0.5):
+                return True
+        except OSError:
+            return False
+
+    def start(self, timeout: float = 30.0):
+        self.proc = subprocess.Popen(self.cmd, cwd=REPO_ROOT)
+        _wait_until(self._listening, self.proc, "stub_openai", timeout)
+
+    def stop(self):
+        _stop_process(self.proc)
+
+
+class LocalApp:
+    """Запускает `uvicorn backend.main:app` отдельным процессом и ждёт /healthz."""
+
+    def __init__(self, port: int, workdir: str, openai_base_url: str):
+        self.port = port
+        self.workdir = workdir
+        self.env = dict(os.environ, OPENAI_BASE_URL=openai_base_url,
+                        PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+        self.env.setdefault("OPENAI_API_KEY", "loadtest-key")
+        self.proc: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _healthy(self) -> bool:
+        try:
+            return httpx.get(f"{self.url}/healthz", timeout=1.0).status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    def start(self, timeout: float = 60.0):
+        cmd = [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+               "--port", str(self.port), "--log-level", "warning"]
+        # Рабочий каталог временный: приложение пишет в относительный data/
+        self.proc = subprocess.Popen(cmd, cwd=self.workdir, env=self.env)
+        _wait_until(self._healthy, self.proc, "uvicorn", timeout)
+
+    def stop(self):
+        _stop_process(self.proc)
+
+
+async def _upload_markdown(client: httpx.AsyncClient, doc_idx: int, tokens: int) -> httpx.Response:
+    body = synthetic_markdown(doc_idx, tokens).encode("utf-8")
+    return await client.post(
+        "/upload-file",
+        files={"file": (f"load_{doc_idx}.md", body, "text/markdown")},
+        data={"pipeline": "markdown", "project": "loadtest"},
+    )
+
+
+async def _seed(client: httpx.AsyncClient, docs: int, tokens: int, timeout: float) -> List[str]:
+    """Загружает документы и ждёт готовности, возвращает job_id."""
+    job_ids = []
+    for i in range(docs):
+        resp = await _upload_markdown(client, i, tokens)
+        resp.raise_for_status()
+        job_ids.append(resp.json()["job_id"])
+    deadline = time.monotonic() + timeout
+    pending = set(job_ids)
+    while pending:
+        for job_id in list(pending):
+            status = (await client.get(f"/job-status/{job_id}")).json()
+            if status["status"] == "ready":
+                pending.discard(job_id)
+            elif status["status"] in ("error", "cancelled"):
+                raise RuntimeError(f"Seed job {job_id} failed: {status.get('detail')}")
+        if pending and time.monotonic() > deadline:
+            raise RuntimeError(f"Seed jobs not ready after {timeout}s: {sorted(pending)}")
+        await asyncio.sleep(0.2)
+    return job_ids
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {e: [] for e in ENDPOINTS}
+        self.errors: Dict[str, int] = {e: 0 for e in ENDPOINTS}
+        self.status_codes: Dict[str, Dict[str, int]] = {e: {} for e in ENDPOINTS}
+
+    def record(self, endpoint: str, latency: float, status: str, ok: bool):
+        self.latencies[endpoint].append(latency)
+        codes = self.status_codes[endpoint]
+        codes[status] = codes.get(status, 0) + 1
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, dict]:
+        out = {}
+        for endpoint, values in self.latencies.items():
+            if not values:
+                continue
+            n = len(values)
+            out[endpoint] = {
+                "requests": n,
+                "errors": self.errors[endpoint],
+                "error_rate": round(self.errors[endpoint] / n, 4),
+                "throughput_rps": round((n - self.errors[endpoint]) / elapsed, 3) if elapsed else 0.0,
+                "p50_ms": round(_percentile(values, 50) * 1000, 2),
+                "p95_ms": round(_percentile(values, 95) * 1000, 2),
+                "p99_ms": round(_percentile(values, 99) * 1000, 2),
+                "max_ms": round(max(values) * 1000, 2),
+                "status_codes": self.status_codes[endpoint],
+            }
+        return out
+
+
+async def run_load(base_url: str, rps: float, duration: float, mix: Dict[str, float], *, seed_docs: int = 3,
+                   seed_tokens: int = 3000, upload_tokens: int = 1000, top_k: int = 5,
+                   max_inflight: int = 500, request_timeout: float = 60.0, seed: int = 0) -> dict:
+    rnd = random.Random(seed)
+    limits = httpx.Limits(max_connections=max_inflight, max_keepalive_connections=max_inflight)
+    async with httpx.AsyncClient(base_url=base_url, timeout=request_timeout, limits=limits) as client:
+        job_ids = await _seed(client, seed_docs, seed_tokens, timeout=request_timeout * 5)
+        logger.info("[load_test] Seeded %d job(s), starting load: %.1f rps for %.0fs", len(job_ids), rps, duration)
+
+        recorder = Recorder()
+        inflight = asyncio.Semaphore(max_inflight)
+        names, weights = zip(*mix.items())
+        upload_counter = iter(range(10_000, 10**9))
+
+        async def fire(endpoint: str, scheduled: float):
+            async with inflight:
+                try:
+                    if endpoint == "query":
+                        resp = await client.post("/query", json={
+                            "question": "Какая вместимость школы и площадь участка?",
+                            "top_k": top_k,
+                            "pipeline": "markdown",
+                        })
+                    elif endpoint == "job-status":
+                        resp = await client.get(f"/job-status/{rnd.choice(job_ids)}")
+                    elif endpoint == "download-bundle":
+                        resp = await client.get(f"/download-bundle/{rnd.choice(job_ids)}")
+                    else:
+                        resp = await _upload_markdown(client, next(upload_counter), upload_tokens)
+                    # 429 — штатный отказ admission control, но для отчёта это ошибка
+                    recorder.record(endpoint, time.perf_counter() - scheduled, str(resp.status_code),
+                                    resp.status_code < 400)
+                except httpx.HTTPError as e:
+                    recorder.record(endpoint, time.perf_counter() - scheduled, type(e).__name__, False)
+
+        tasks = []
+        start = time.perf_counter()
+        total = int(rps * duration)
+        for i in range(total):
+            scheduled = start + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            endpoint = rnd.choices(names, weights)[0]
+            tasks.append(asyncio.create_task(fire(endpoint, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    all_latencies = [v for vals in recorder.latencies.values() for v in vals]
+    total_errors = sum(recorder.errors.values())
+    return {
+        "target_rps": rps,
+        "duration_s": round(elapsed, 3),
+        "requests": len(all_latencies),
+        "achieved_rps": round(len(all_latencies) / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(total_errors / len(all_latencies), 4) if all_latencies else 0.0,
+        "p50_ms": round(_percentile(all_latencies, 50) * 1000, 2),
+        "p95_ms": round(_percentile(all_latencies, 95) * 1000, 2),
+        "p99_ms": round(_percentile(all_latencies, 99) * 1000, 2),
+        "endpoints": recorder.summary(elapsed),
+    }
+
+
+def _print_report(report: dict):
+    print(f"\nTarget {report['target_rps']} rps, achieved {report['achieved_rps']} rps over {report['duration_s']}s, "
+          f"error rate {report['error_rate']:.2%}")
+    print(f"{'endpoint':<17}{'reqs':>7}{'err%':>8}{'rps':>8}{'p50,ms':>10}{'p95,ms':>10}{'p99,ms':>10}{'max,ms':>10}")
+    for name, s in report["endpoints"].items():
+        print(f"{name:<17}{s['requests']:>7}{s['error_rate'] * 100:>7.1f}%{s['throughput_rps']:>8.2f}"
+              f"{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест backend (open-loop, заданный RPS)")
+    parser.add_argument("--url", default=None, help="Уже запущенный backend; по умолчанию поднимается локально")
+    parser.add_argument("--rps", type=float, default=10.0)
+    parser.add_argument("--duration", type=float, default=20.0, help="Длительность подачи нагрузки, сек")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Веса endpoint'ов: query,job-status,upload,download-bundle")
+    parser.add_argument("--seed-docs", type=int, default=3)
+    parser.add_argument("--seed-tokens", type=int, default=3000)
+    parser.add_argument("--upload-tokens", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-inflight", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Таймаут одного запроса, сек")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Задержка заглушки OpenAI (локальный режим)")
+    parser.add_argument("--per-item-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--out", default=None, help="Куда записать JSON-отчёт")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"),
+                        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    logger.setLevel(logging.INFO)
+    mix = parse_mix(args.mix)
+
+    stub = app = workdir = None
+    base_url = args.url
+    try:
+        if base_url is None:
+            stub = LocalStub(_free_port(), args.latency_ms, args.per_item_ms, args.jitter_ms)
+            stub.start()
+            workdir = tempfile.mkdtemp(prefix="load-test-")
+            app = LocalApp(_free_port(), workdir, stub.base_url)
+            app.start()
+            base_url = app.url
+        report = asyncio.run(run_load(
+            base_url, args.rps, args.duration, mix,
+            seed_docs=args.seed_docs, seed_tokens=args.seed_tokens, upload_tokens=args.upload_tokens,
+            top_k=args.top_k, max_inflight=args.max_inflight, request_timeout=args.timeout,
+        ))
+    finally:
+        if app is not None:
+            app.stop()
+        if stub is not None:
+            stub.stop()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report["mix"] = mix
+    _print_report(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nОтчёт сохранён: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Локальная заглушка OpenAI API для офлайн-бенчмарков.
+
+Реализует `POST /v1/embeddings` и `POST /v1/chat/completions` в формате,
+который понимает клиент `openai`. Эмбеддинги детерминированы (зависят
+только от текста), задержка ответа настраивается. Клиент направляется
+на заглушку через переменную окружения `OPENAI_BASE_URL`.
+
+Запуск отдельно:
+    python -m benchmarks.stub_openai --port 8100 --latency-ms 50
+"""
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIMENSIONS = 3072  # text-embedding-3-large
+
+
+def fake_embedding(text: str, dimensions: int = DEFAULT_DIMENSIONS) -> List[float]:
+    """Детерминированный единичный вектор, зависящий только от текста."""
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "big")
+    rnd = random.Random(seed)
+    vec = [rnd.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [round(v / norm, 6) for v in vec]
+
+
+def _approx_tokens(text: str) -> int:
+    # Грубая оценка без tiktoken: ~4 символа на токен
+    return max(1, len(text) // 4)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: "StubOpenAIServer"
+
+    def log_message(self, fmt, *args):  # noqa: N802 - тихий режим вместо stderr
+        logger.debug("[stub_openai] " + fmt, *args)
+
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):  # noqa: N802
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid json", "type": "invalid_request_error"}})
+            return
+
+        srv = self.server
+        srv.record_request(self.path)
+        if srv.error_rate and srv.rng_random() < srv.error_rate:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                headers={"Retry-After": "1"},
+            )
+            return
+
+        if self.path.rstrip("/").endswith("/embeddings"):
+            self._handle_embeddings(body)
+        elif self.path.rstrip("/").endswith("/chat/completions"):
+            self._handle_chat(body)
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def _handle_embeddings(self, body: dict):
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = int(body.get("dimensions") or DEFAULT_DIMENSIONS)
+        # Клиент openai при установленном numpy просит base64 (float32 LE), как и настоящий API
+        as_base64 = body.get("encoding_format") == "base64"
+        self.server.sleep(len(inputs))
+        data = []
+        for i, text in enumerate(inputs):
+            vec = fake_embedding(str(text), dimensions)
+            if as_base64:
+                vec = base64.b64encode(struct.pack(f"<{dimensions}f", *vec)).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vec})
+        tokens = sum(_approx_tokens(str(t)) for t in inputs)
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-3-large"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _handle_chat(self, body: dict):
+        self.server.sleep(1)
+        messages = body.get("messages") or []
+        prompt = messages[-1].get("content", "") if messages else ""
+        prompt_tokens = _approx_tokens(prompt)
+        content = f"Заглушка ответа ({prompt_tokens} токенов в запросе)."
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": _approx_tokens(content),
+                "total_tokens": prompt_tokens + _approx_tokens(content),
+            },
+        })
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    """HTTP-сервер заглушки с настраиваемой задержкой и долей ошибок 429."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency_ms: float = 0.0, per_item_ms: float = 0.0,
+                 jitter_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        super().__init__(address, _StubHandler)
+        self.latency_ms = latency_ms
+        self.per_item_ms = per_item_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.request_counts: dict = {}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def rng_random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def record_request(self, path: str):
+        with self._lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+
+    def sleep(self, items: int):
+        delay = self.latency_ms + self.per_item_ms * items
+        if self.jitter_ms:
+            with self._lock:
+                delay += self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, **kwargs) -> StubOpenAIServer:
+    """Запускает заглушку в фоновом потоке; `port=0` — выбрать свободный порт."""
+    server = StubOpenAIServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, name="stub-openai", daemon=True)
+    thread.start()
+    logger.info("[stub_openai] Listening on %s", server.base_url)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка OpenAI embeddings/chat API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Базовая задержка ответа")
+    parser.add_argument("--per-item-ms", type=float, default=0.0, help="Доп. задержка на каждый вход эмбеддингов")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 429 (0-1)")
+    args = parser.parse_args()
+    logging.basicConfig(level="INFO", format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    server = StubOpenAIServer(
+        (args.host, args.port),
+        latency_ms=args.latency_ms,
+        per_item_ms=args.per_item_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+    )
+    logger.info("[stub_openai] Listening on %s (export OPENAI_BASE_URL=%s)", server.base_url, server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
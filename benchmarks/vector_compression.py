@@ -0,0 +1,139 @@
+"""
+Отчёт о сжатии векторов: память и recall@k относительно текущего IndexFlatL2.
+
+Сравнивает сокращённые размерности эмбеддингов (первые d компонент с
+перенормировкой — так ведут себя `dimensions` у text-embedding-3) и
+хранение flat / fp16 / int8 с точным re-rank по полноточным векторам и без.
+Индексы строятся теми же `build_index` / `search_index`, что и в сервисе.
+
+Векторы берутся из существующих flat-индексов (`--index-dir`, реальные
+эмбеддинги) или генерируются (`--synthetic N`, кластеризованные). У
+синтетических векторов информация не сосредоточена в первых компонентах,
+поэтому recall для сокращённых размерностей на них занижен — для решения
+о `EMBEDDING_DIMENSIONS` смотрите на реальные индексы.
+
+    python -m benchmarks.vector_compression --index-dir data/index --dims 3072,1024,512,256
+    python -m benchmarks.vector_compression --synthetic 20000 --queries 200 --out compression.json
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+from backend.utils.faiss_index import build_index, search_index
+
+
+def load_index_vectors(index_dir: str) -> np.ndarray:
+    """Достаёт float32-векторы из flat-индексов каталога (SQ-индексы пропускаются)."""
+    parts = []
+    for path in sorted(glob.glob(os.path.join(index_dir, "*.faiss"))):
+        index = faiss.read_index(path)
+        if not isinstance(index, faiss.IndexFlat):
+            continue
+        parts.append(index.reconstruct_n(0, index.ntotal))
+    if not parts:
+        raise SystemExit(f"В {index_dir} нет flat-индексов; используйте --synthetic")
+    dims = {p.shape[1] for p in parts}
+    if len(dims) > 1:
+        raise SystemExit(f"Индексы разной размерности: {sorted(dims)}")
+    return np.vstack(parts).astype("float32")
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 20), dim)).astype("float32")
+    vecs = centers[rng.integers(0, len(centers), n)] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+    return _normalize(vecs)
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return (x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)).astype("float32")
+
+
+def truncate(x: np.ndarray, dim: int) -> np.ndarray:
+    return _normalize(x[:, :dim]) if dim < x.shape[1] else x
+
+
+def make_queries(corpus: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    """Запросы — зашумлённые векторы корпуса (похожи на вопрос по фрагменту)."""
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.choice(len(corpus), size=min(n, len(corpus)), replace=False)]
+    return _normalize(picks + 0.3 * rng.standard_normal(picks.shape).astype("float32") / np.sqrt(corpus.shape[1]) * 4)
+
+
+def evaluate(corpus: np.ndarray, queries: np.ndarray, gt: np.ndarray, dim: int, storage: str,
+             rerank: bool, top_k: int, oversample: int) -> dict:
+    vecs = truncate(corpus, dim)
+    q = truncate(queries, dim)
+    index = build_index(vecs, storage)
+    index_bytes = len(faiss.serialize_index(index))
+    hits = 0
+    start = time.perf_counter()
+    for i in range(len(q)):
+        _, ids = search_index(index, q[i:i + 1], top_k, vecs if rerank else None, oversample)
+        hits += len(set(ids.tolist()) & set(gt[i].tolist()))
+    elapsed = time.perf_counter() - start
+    return {
+        "dims": dim,
+        "storage": storage,
+        "rerank": rerank,
+        "index_bytes": index_bytes,
+        "bytes_per_vector": round(index_bytes / len(vecs), 1),
+        "rerank_disk_bytes": int(vecs.nbytes) if rerank else 0,
+        f"recall@{top_k}": round(hits / (len(q) * top_k), 4),
+        "search_ms_per_query": round(elapsed / len(q) * 1000, 3),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Память и recall сжатых FAISS-индексов")
+    parser.add_argument("--index-dir", default=None, help="Каталог с flat-индексами (реальные эмбеддинги)")
+    parser.add_argument("--synthetic", type=int, default=10000, help="Число синтетических векторов")
+    parser.add_argument("--dim", type=int, default=3072, help="Размерность синтетических векторов")
+    parser.add_argument("--dims", default="3072,1024,512,256", help="Проверяемые размерности (через запятую)")
+    parser.add_argument("--storages", default="flat,fp16,int8")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--oversample", type=int, default=4, help="Кандидатов на re-rank = top_k * oversample")
+    parser.add_argument("--out", default=None, help="Куда записать JSON-отчёт")
+    args = parser.parse_args(argv)
+
+    corpus = load_index_vectors(args.index_dir) if args.index_dir else synthetic_vectors(args.synthetic, args.dim)
+    queries = make_queries(corpus, args.queries)
+    top_k = min(args.top_k, len(corpus))
+    # Эталон — текущая схема: IndexFlatL2 на полной размерности
+    _, gt = build_index(corpus, "flat").search(queries, top_k)
+
+    dims = sorted({min(int(d), corpus.shape[1]) for d in args.dims.split(",")}, reverse=True)
+    storages = [s.strip() for s in args.storages.split(",") if s.strip()]
+    rows = []
+    for dim in dims:
+        for storage in storages:
+            for rerank in ((False,) if storage == "flat" else (False, True)):
+                rows.append(evaluate(corpus, queries, gt, dim, storage, rerank, top_k, args.oversample))
+
+    baseline = next(r for r in rows if r["dims"] == corpus.shape[1] and r["storage"] == "flat")
+    recall_key = f"recall@{top_k}"
+    print(f"\nКорпус: {len(corpus)} векторов × {corpus.shape[1]}, запросов: {len(queries)}, k={top_k}")
+    print(f"{'dims':>6} {'storage':<8}{'rerank':<8}{'B/vec':>9}{'vs flat':>9}{'disk B/vec':>11}{recall_key:>11}{'ms/q':>8}")
+    for r in rows:
+        ratio = baseline["index_bytes"] / r["index_bytes"]
+        disk = r["rerank_disk_bytes"] / len(corpus)
+        print(f"{r['dims']:>6} {r['storage']:<8}{str(r['rerank']):<8}{r['bytes_per_vector']:>9.0f}{ratio:>8.1f}x"
+              f"{disk:>11.0f}{r[recall_key]:>11.4f}{r['search_ms_per_query']:>8.3f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"vectors": len(corpus), "dim": int(corpus.shape[1]), "queries": len(queries),
+                       "top_k": top_k, "results": rows}, f, ensure_ascii=False, indent=2)
+        print(f"\nОтчёт сохранён: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -71,8 +71,11 @@ if job_id:
             break
         data = resp.json()
         progress_bar.progress(data["progress"])
-        status_area.info(f"Статус: {data['status']} | {data.get('detail','')}")
-        if data["status"] in ["ready", "error"]:
+        if data["status"] == "queued" and data.get("queue_position"):
+            status_area.info(f"Статус: в очереди, позиция {data['queue_position']}")
+        else:
+            status_area.info(f"Статус: {data['status']} | {data.get('detail','')}")
+        if data["status"] in ["ready", "error", "cancelled"]:
             break
         time.sleep(1)
     if data["status"] == "ready":
@@ -60,8 +60,11 @@ if job_id:
             break
         data = r.json()
         progbar.progress(data["progress"])
-        prog_placeholder.info(f"Статус: {data['status']} | {data.get('detail', '')}")
-        if data["status"] in ("ready", "error"):
+        if data["status"] == "queued" and data.get("queue_position"):
+            prog_placeholder.info(f"Статус: в очереди, позиция {data['queue_position']}")
+        else:
+            prog_placeholder.info(f"Статус: {data['status']} | {data.get('detail', '')}")
+        if data["status"] in ("ready", "error", "cancelled"):
             break
         time.sleep(1)
     if data["status"] == "ready":
@@ -0,0 +1,120 @@
+import pytest
+
+from backend.utils import durable_queue
+from backend.utils.job_queue import QueueFull
+
+# Отрицательная аренда истекает сразу — так моделируем упавший воркер без ожидания
+EXPIRED = -1.0
+
+
+@pytest.fixture(autouse=True)
+def queue_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(durable_queue, "QUEUE_DB_PATH", str(tmp_path / "queue.sqlite"))
+
+
+def _enqueue(job_id="job-1", priority=0, **kwargs):
+    payload = {"files": [["a.md", "fid-" + job_id, "data/original/a.md"]], "pipeline": "markdown"}
+    durable_queue.enqueue(job_id, priority, payload, project="p", pipeline="markdown", **kwargs)
+
+
+def _heartbeat(job_id, worker_id):
+    return durable_queue.heartbeat(job_id, worker_id, stage="converting", progress=0.5, detail=None, file_ids=[])
+
+
+def _finish(job_id, worker_id, status="ready"):
+    return durable_queue.finish(job_id, worker_id, status=status, progress=1.0, detail=None, file_ids=["fid"])
+
+
+def test_claim_takes_jobs_in_priority_order():
+    _enqueue("zip", priority=2)
+    _enqueue("file", priority=0)
+    assert durable_queue.claim("w1")["id"] == "file"
+    assert durable_queue.claim("w1")["id"] == "zip"
+    assert durable_queue.claim("w1") is None
+
+
+def test_enqueue_respects_max_queued():
+    _enqueue("job-1", max_queued=1)
+    with pytest.raises(QueueFull):
+        _enqueue("job-2", max_queued=1)
+    assert durable_queue.get_job("job-2") is None
+
+
+def test_live_lease_is_not_reclaimed():
+    _enqueue()
+    durable_queue.claim("w1", lease_seconds=60)
+    assert durable_queue.claim("w2") is None
+    assert _heartbeat("job-1", "w1") is False
+
+
+def test_expired_lease_is_claimed_by_another_worker():
+    _enqueue()
+    first = durable_queue.claim("w1", lease_seconds=EXPIRED)
+    assert first["attempt"] == 1
+
+    retry = durable_queue.claim("w2", lease_seconds=60)
+    assert retry["id"] == "job-1"
+    assert retry["attempt"] == 2
+    # Старый воркер потерял аренду: ни heartbeat, ни итог от него не принимаются
+    assert _heartbeat("job-1", "w1") is None
+    assert _finish("job-1", "w1") is False
+    assert _finish("job-1", "w2") is True
+    assert durable_queue.get_job("job-1")["status"] == "ready"
+
+
+def test_job_fails_after_max_attempts():
+    _enqueue(max_attempts=2)
+    assert durable_queue.claim("w1", lease_seconds=EXPIRED)["attempt"] == 1
+    assert durable_queue.claim("w2", lease_seconds=EXPIRED)["attempt"] == 2
+    assert durable_queue.claim("w3") is None
+
+    job = durable_queue.get_job("job-1")
+    assert job["status"] == "error"
+    assert job["attempts"] == 2
+
+
+def test_cancel_queued_job_dequeues_it():
+    _enqueue()
+    assert durable_queue.cancel("job-1") == "dequeued"
+    assert durable_queue.get_job("job-1")["status"] == "cancelled"
+    assert durable_queue.claim("w1") is None
+    assert durable_queue.cancel("job-1") is None
+
+
+def test_cancel_running_job_is_seen_by_heartbeat():
+    _enqueue()
+    durable_queue.claim("w1", lease_seconds=60)
+    assert durable_queue.cancel("job-1") == "cancelling"
+    assert _heartbeat("job-1", "w1") is True
+    assert _finish("job-1", "w1", status="cancelled") is True
+    assert durable_queue.get_job("job-1")["status"] == "cancelled"
+
+
+def test_cancelled_job_with_expired_lease_is_not_retried():
+    _enqueue()
+    durable_queue.claim("w1", lease_seconds=EXPIRED)
+    assert durable_queue.cancel("job-1") == "cancelling"
+    assert durable_queue.claim("w2") is None
+    assert durable_queue.get_job("job-1")["status"] == "cancelled"
+
+
+def test_release_returns_job_without_spending_an_attempt():
+    _enqueue()
+    durable_queue.claim("w1", lease_seconds=60)
+    assert durable_queue.release("job-1", "w2") is False
+    assert durable_queue.release("job-1", "w1") is True
+
+    job = durable_queue.get_job("job-1")
+    assert job["status"] == "queued"
+    assert job["queue_position"] == 1
+    assert durable_queue.claim("w2")["attempt"] == 1
+
+
+def test_latest_ready_prefers_matching_pipeline():
+    for job_id, pipeline in (("md", "markdown"), ("dl", "docling")):
+        durable_queue.enqueue(job_id, 0, {"files": []}, project="p", pipeline=pipeline, file_id="fid-" + job_id)
+        durable_queue.claim("w1")
+        _finish(job_id, "w1")
+
+    assert durable_queue.latest_ready("markdown") == {"file_id": "fid-md", "pipeline": "markdown"}
+    assert durable_queue.latest_ready("markitdown")["file_id"] == "fid-dl"
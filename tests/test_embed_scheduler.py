@@ -0,0 +1,117 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from backend.utils import embed_scheduler
+from backend.utils.embed_scheduler import PRIORITY_INGEST, PRIORITY_QUERY, EmbeddingDispatcher
+
+
+class FakeEmbeddings:
+    """Клиент embeddings API: запоминает запросы, по очереди отдаёт заготовленные ошибки."""
+
+    def __init__(self, errors=()):
+        self.calls = []
+        self.errors = list(errors)
+        self.lock = threading.Lock()
+
+    def with_options(self, **kwargs):
+        return SimpleNamespace(embeddings=self)
+
+    def create(self, input, model, **extra):
+        with self.lock:
+            self.calls.append((time.monotonic(), list(input)))
+            error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        data = [SimpleNamespace(index=i, embedding=[float(len(text))]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=data, usage=None)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeEmbeddings()
+    monkeypatch.setattr(embed_scheduler, "get_openai_client", lambda: fake)
+    return fake
+
+
+def _rate_limited(retry_after="0.2"):
+    request = httpx.Request("POST", "http://stub/v1/embeddings")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def _submit(dispatcher, texts, tokens, priority=PRIORITY_INGEST, dimensions=256):
+    return dispatcher.submit(texts, [tokens] * len(texts), dimensions, priority=priority)
+
+
+def test_query_is_not_padded_with_ingest_and_skips_their_budget(client):
+    dispatcher = EmbeddingDispatcher("m", batch_wait_ms=0, concurrency=4, tpm_limit=120000)
+    # Первый батч загрузки выбирает весь минутный бюджет, остальная загрузка ждёт его
+    backlog = _submit(dispatcher, [f"chunk {i}" for i in range(2000)], tokens=500)
+    backlog[0].result(timeout=5)
+
+    start = time.monotonic()
+    question = _submit(dispatcher, ["вопрос"], tokens=5, priority=PRIORITY_QUERY)
+    assert question[0].result(timeout=5) == [float(len("вопрос"))]
+    assert time.monotonic() - start < 1.0
+    assert client.calls[-1][1] == ["вопрос"]
+    for future in backlog:
+        future.cancel()
+
+
+def test_single_slot_still_reserves_one_for_queries(client):
+    dispatcher = EmbeddingDispatcher("m", concurrency=1)
+    assert dispatcher.ingest_concurrency == 1
+    assert dispatcher.concurrency == 2
+    dispatcher._inflight[PRIORITY_INGEST] = 1
+    assert dispatcher._has_slot(PRIORITY_QUERY)
+    assert not dispatcher._has_slot(PRIORITY_INGEST)
+
+
+def test_rate_limit_pauses_and_requeues_the_batch(client):
+    client.errors = [_rate_limited("0.3")]
+    dispatcher = EmbeddingDispatcher("m", batch_wait_ms=0)
+    futures = _submit(dispatcher, ["a", "bb", "ccc"], tokens=1)
+
+    assert [f.result(timeout=5) for f in futures] == [[1.0], [2.0], [3.0]]
+    assert len(client.calls) == 2
+    assert client.calls[1][1] == ["a", "bb", "ccc"]
+    assert client.calls[1][0] - client.calls[0][0] >= 0.3
+
+
+def test_rate_limit_gives_up_after_max_retries(client):
+    client.errors = [_rate_limited("0"), _rate_limited("0")]
+    dispatcher = EmbeddingDispatcher("m", batch_wait_ms=0, max_retries=1)
+    future = _submit(dispatcher, ["a"], tokens=1)[0]
+
+    with pytest.raises(openai.RateLimitError):
+        future.result(timeout=5)
+    assert len(client.calls) == 2
+
+
+def test_cancelled_queued_input_is_never_sent(client):
+    # Лимит в один запрос в минуту: второй батч стоит в очереди, пока его не отменят
+    dispatcher = EmbeddingDispatcher("m", batch_wait_ms=0, rpm_limit=1)
+    _submit(dispatcher, ["first"], tokens=1)[0].result(timeout=5)
+    waiting = _submit(dispatcher, ["second"], tokens=1)[0]
+
+    assert waiting.cancel()
+    time.sleep(0.1)
+    assert dispatcher.queued() == 0
+    assert [texts for _, texts in client.calls] == [["first"]]
+
+
+def test_cancelled_input_waiting_for_retry_is_not_resent(client):
+    client.errors = [_rate_limited("0.3")]
+    dispatcher = EmbeddingDispatcher("m", batch_wait_ms=0)
+    futures = _submit(dispatcher, ["a", "b"], tokens=1)
+    while not client.calls:
+        time.sleep(0.01)
+
+    futures[0].cancel()
+    assert futures[1].result(timeout=5) == [1.0]
+    assert [texts for _, texts in client.calls] == [["a", "b"], ["b"]]
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from backend.utils.job_queue import PRIORITY_BATCH, PRIORITY_FILE, PRIORITY_ZIP, JobScheduler, QueueFull
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class Jobs:
+    """Фабрики задач, которые выполняются, пока их не отпустят."""
+
+    def __init__(self):
+        self.started = []
+        self.gates = {}
+
+    def factory(self, job_id):
+        gate = self.gates[job_id] = asyncio.Event()
+
+        async def job():
+            self.started.append(job_id)
+            await gate.wait()
+
+        return job
+
+
+def test_jobs_start_in_priority_order():
+    async def scenario():
+        jobs = Jobs()
+        scheduler = JobScheduler(max_concurrent=1, max_queued=10)
+        scheduler.submit("first", PRIORITY_ZIP, jobs.factory("first"))
+        for job_id, priority in (("zip", PRIORITY_ZIP), ("batch", PRIORITY_BATCH), ("file", PRIORITY_FILE)):
+            scheduler.submit(job_id, priority, jobs.factory(job_id))
+        await _settle()
+        assert [scheduler.position(j) for j in ("file", "batch", "zip")] == [1, 2, 3]
+        assert scheduler.position("first") is None
+
+        for job_id in ("first", "file", "batch", "zip"):
+            jobs.gates[job_id].set()
+            await _settle()
+        return jobs.started
+
+    assert _run(scenario()) == ["first", "file", "batch", "zip"]
+
+
+def test_full_only_when_queue_and_slots_are_taken():
+    async def scenario():
+        jobs = Jobs()
+        scheduler = JobScheduler(max_concurrent=1, max_queued=1)
+        scheduler.submit("running", PRIORITY_FILE, jobs.factory("running"))
+        await _settle()
+        assert not scheduler.is_full()
+        scheduler.submit("queued", PRIORITY_FILE, jobs.factory("queued"))
+        assert scheduler.is_full()
+        with pytest.raises(QueueFull):
+            scheduler.submit("rejected", PRIORITY_FILE, jobs.factory("rejected"))
+
+        jobs.gates["running"].set()
+        await _settle()
+        assert scheduler.running() == 1 and scheduler.queued() == 0
+        assert not scheduler.is_full()
+        jobs.gates["queued"].set()
+        await _settle()
+
+    _run(scenario())
+
+
+def test_cancel_dequeues_waiting_job_and_flags_running_one():
+    async def scenario():
+        jobs = Jobs()
+        scheduler = JobScheduler(max_concurrent=1, max_queued=10)
+        scheduler.submit("running", PRIORITY_FILE, jobs.factory("running"))
+        scheduler.submit("waiting", PRIORITY_FILE, jobs.factory("waiting"))
+        await _settle()
+
+        assert scheduler.cancel("waiting") == "dequeued"
+        assert scheduler.position("waiting") is None
+        assert scheduler.cancel("running") == "cancelling"
+        assert scheduler.cancel("unknown") is None
+
+        jobs.gates["running"].set()
+        await _settle()
+        assert scheduler.running() == 0
+        return jobs.started
+
+    assert _run(scenario()) == ["running"]
+
+
+def test_crashed_job_frees_its_slot():
+    async def scenario():
+        jobs = Jobs()
+        scheduler = JobScheduler(max_concurrent=1, max_queued=10)
+
+        async def crash():
+            raise RuntimeError("boom")
+
+        scheduler.submit("crash", PRIORITY_FILE, crash)
+        scheduler.submit("next", PRIORITY_FILE, jobs.factory("next"))
+        await _settle()
+        jobs.gates["next"].set()
+        await _settle()
+        return jobs.started
+
+    assert _run(scenario()) == ["next"]